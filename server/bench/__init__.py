@@ -0,0 +1 @@
+"""Offline benchmark suite. See bench/run.py."""
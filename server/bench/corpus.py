@@ -0,0 +1,100 @@
+"""
+Generated fixture corpus for the benchmark: text PDFs, scanned (image-only)
+PDFs, DOCX and TXT files. Documents are built from a seed, so a run can use
+a distinct document per request to measure uncached work, or the same one
+to measure cache hits.
+"""
+
+import io
+import random
+from typing import Tuple
+
+KINDS = ("text_pdf", "scanned_pdf", "docx", "txt")
+
+MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".txt": "text/plain",
+}
+
+TOPICS = [
+    "Neurons in the brain are densely interconnected and work in parallel",
+    "Transistors in a microprocessor are wired in simple serial chains",
+    "Glial cells support and protect neurons and feed them with energy",
+    "Artificial neural networks learn by adjusting the weights of connections",
+    "Backpropagation compares the network output with the expected output",
+    "Memory in the brain is distributed across many connections",
+    "Logic gates combine transistors into adders, registers and memories",
+    "Training data shapes what patterns a network is able to recognise",
+]
+WORDS = (
+    "because therefore however signal layer input output weight pattern learning memory energy cell "
+    "structure process system parallel serial computer brain network model example result change"
+).split()
+
+
+def _paragraphs(rng: random.Random, count: int):
+    for _ in range(count):
+        sentences = []
+        for _ in range(rng.randint(3, 6)):
+            sentence = rng.choice(TOPICS) + ", " + " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 14)))
+            sentences.append(sentence + ".")
+        yield " ".join(sentences)
+
+
+def _pages(seed: int, pages: int):
+    rng = random.Random(seed)
+    return [list(_paragraphs(rng, 4)) for _ in range(pages)]
+
+
+def _text_pdf(pages, scanned: bool) -> bytes:
+    import fitz
+    document = fitz.open()
+    for paragraphs in pages:
+        page = document.new_page()
+        page.insert_textbox(page.rect + (56, 56, -56, -56), "\n\n".join(paragraphs), fontsize=11)
+    if not scanned:
+        return document.tobytes()
+
+    # Replace every page with a picture of itself, as a scanner would produce
+    scanned_document = fitz.open()
+    for page in document:
+        pixmap = page.get_pixmap(dpi=150, colorspace=fitz.csGRAY)
+        scanned_page = scanned_document.new_page(width=page.rect.width, height=page.rect.height)
+        scanned_page.insert_image(scanned_page.rect, pixmap=pixmap)
+    return scanned_document.tobytes()
+
+
+def _docx(pages) -> bytes:
+    from docx import Document
+    document = Document()
+    for paragraphs in pages:
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_document(kind: str, seed: int = 0, pages: int = 4) -> Tuple[str, bytes]:
+    """
+    Build one fixture document.
+
+    Args:
+        kind: One of KINDS
+        seed: Seed for the document's text
+        pages: Number of pages of text
+
+    Returns:
+        (filename, content)
+    """
+    content = _pages(seed, pages)
+    if kind == "text_pdf":
+        return f"text-{seed}.pdf", _text_pdf(content, scanned=False)
+    if kind == "scanned_pdf":
+        return f"scanned-{seed}.pdf", _text_pdf(content, scanned=True)
+    if kind == "docx":
+        return f"document-{seed}.docx", _docx(content)
+    if kind == "txt":
+        return f"text-{seed}.txt", "\n\n".join("\n\n".join(page) for page in content).encode("utf-8")
+    raise ValueError(f"Unknown fixture kind: {kind}")
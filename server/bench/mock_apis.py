@@ -0,0 +1,151 @@
+"""
+Local stand-ins for the Groq chat completions API and the Google Custom
+Search API, so the server can be benchmarked offline.
+
+Point the server at them with GROQ_BASE_URL=http://127.0.0.1:<port> and
+GOOGLE_SEARCH_ENDPOINT=http://127.0.0.1:<port>/. Replies are shaped after
+the prompt: JSON mode calls get a question set, a mind map or, for fused
+calls, every field the prompt names; everything else gets plain text.
+Latency, rate limiting and streaming speed are set with:
+
+- MOCK_LLM_LATENCY, MOCK_LLM_JITTER: seconds before a completion starts
+- MOCK_STREAM_TOKENS_PER_SECOND: pace of streamed completions
+- MOCK_RATE_LIMIT: fraction of completions answered with 429
+- MOCK_RETRY_AFTER: retry-after seconds sent with each 429
+- MOCK_SEARCH_LATENCY, MOCK_SEARCH_JITTER: seconds per search
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+MOCK_LLM_LATENCY = float(os.getenv('MOCK_LLM_LATENCY', '0.5'))
+MOCK_LLM_JITTER = float(os.getenv('MOCK_LLM_JITTER', '0.2'))
+MOCK_STREAM_TOKENS_PER_SECOND = float(os.getenv('MOCK_STREAM_TOKENS_PER_SECOND', '300'))
+MOCK_RATE_LIMIT = float(os.getenv('MOCK_RATE_LIMIT', '0'))
+MOCK_RETRY_AFTER = float(os.getenv('MOCK_RETRY_AFTER', '1'))
+MOCK_SEARCH_LATENCY = float(os.getenv('MOCK_SEARCH_LATENCY', '0.3'))
+MOCK_SEARCH_JITTER = float(os.getenv('MOCK_SEARCH_JITTER', '0.1'))
+
+WORDS = (
+    "neurons transistors memory learning network signal layer pattern cell energy model data "
+    "structure process system brain computer logic parallel serial connection input output"
+).split()
+
+app = FastAPI()
+_ids = itertools.count()
+
+
+def _words(count: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(count))
+
+
+def _rate_limit_headers() -> dict:
+    return {
+        "x-ratelimit-limit-requests": "14400",
+        "x-ratelimit-remaining-requests": "14000",
+        "x-ratelimit-reset-requests": "6s",
+        "x-ratelimit-limit-tokens": "60000",
+        "x-ratelimit-remaining-tokens": "50000",
+        "x-ratelimit-reset-tokens": "1s",
+    }
+
+
+def _mind_map() -> dict:
+    return {
+        "title": {"text": _words(3), "description": _words(12)},
+        "categories": [{
+            "text": _words(2), "description": _words(10),
+            "subcategories": [{"text": _words(2), "description": _words(8), "subcategories": []}
+                              for _ in range(3)],
+        } for _ in range(5)],
+    }
+
+
+def _question_set(count: int = 5) -> dict:
+    return {"questions": [_words(10) + "?" for _ in range(count)], "answers": [_words(20) for _ in range(count)]}
+
+
+def _reply(body: dict) -> str:
+    prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+    length = min(int(body.get("max_completion_tokens") or body.get("max_tokens") or 512), 400)
+    if body.get("response_format", {}).get("type") == "json_object":
+        if "TEXT TO ANALYZE" in prompt:
+            # A fused call: answer every field the prompt asks for
+            fields = {
+                "summary": lambda: _words(150),
+                "questions": _question_set,
+                "mindmap": _mind_map,
+                "search_queries": lambda: [_words(5) for _ in range(2)],
+            }
+            return json.dumps({name: make() for name, make in fields.items() if f'"{name}"' in prompt})
+        if "categories" in prompt:
+            return json.dumps(_mind_map())
+        return json.dumps(_question_set())
+    if "search quer" in prompt:
+        return "\n".join(_words(5) for _ in range(max(1, length // 100)))
+    return _words(length * 3 // 4)
+
+
+async def _delay(latency: float, jitter: float) -> None:
+    await asyncio.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < MOCK_RATE_LIMIT:
+        headers = _rate_limit_headers()
+        headers.update({"retry-after": str(MOCK_RETRY_AFTER), "x-ratelimit-remaining-requests": "0"})
+        return JSONResponse(
+            status_code=429, headers=headers,
+            content={"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+        )
+
+    await _delay(MOCK_LLM_LATENCY, MOCK_LLM_JITTER)
+    completion_id = f"chatcmpl-{next(_ids)}"
+    created = int(time.time())
+    model = body.get("model", "mock")
+    content = _reply(body)
+
+    if body.get("stream"):
+        async def chunks():
+            for i, word in enumerate(content.split(" ")):
+                delta = {"content": word if i == 0 else " " + word}
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(1 / MOCK_STREAM_TOKENS_PER_SECOND)
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream", headers=_rate_limit_headers())
+
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return JSONResponse(headers=_rate_limit_headers(), content={
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    })
+
+
+@app.get("/customsearch/v1")
+async def custom_search(q: str, num: int = 10):
+    await _delay(MOCK_SEARCH_LATENCY, MOCK_SEARCH_JITTER)
+    slug = "-".join(q.lower().split())[:60]
+    return {"items": [
+        {"title": f"{q} ({i + 1})", "link": f"https://example.com/{slug}/{i + 1}", "snippet": _words(20)}
+        for i in range(min(num, 10))
+    ]}
@@ -0,0 +1,270 @@
+"""
+Offline end-to-end benchmark for /analyze-content.
+
+Starts the local Groq and Custom Search stand-ins (bench/mock_apis.py) and
+the server pointed at them, then sends fixture documents (bench/corpus.py)
+with a fixed concurrency, once per analysis. Reports latency percentiles per
+document kind and analysis, per-stage percentiles from the Server-Timing
+header when the server sends one, throughput and the peak RSS of the server's
+process tree (read from /proc, so Linux only).
+
+Run from the server directory:
+
+    python -m bench.run --requests 40 --concurrency 8 --analyses summary,questions
+    python -m bench.run --kinds txt,text_pdf --rate-limit 0.1 --json results.json
+    python -m bench.run --analyses summary+questions+resources --fused
+
+Scanned PDFs are OCR'd, so the OCR models must already be downloaded.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench.corpus import KINDS, MIME_TYPES, make_document
+
+ANALYSES = ("summary", "questions", "mindmap", "resources")
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FORM = {
+    "summary_length": "medium",
+    "question_number": "5",
+    "question_difficulty": "moderate",
+    "layout": "radial",
+    "theme": "dark",
+    "mindmap_format": "svg",
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start(app: str, port: int, env: dict, workers: int = 1) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=SERVER_DIR, env=env,
+    )
+
+
+async def _wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise TimeoutError(f"{url} didn't start within {timeout} seconds")
+
+
+def _process_tree_rss(pid: int) -> int:
+    """Current resident set size of a process and all its descendants, in bytes."""
+    children = defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name may contain spaces; fields resume after its ')'
+                ppid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children[ppid].append(int(entry))
+
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f"/proc/{current}/statm") as statm:
+                total += int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+async def _sample_rss(pid: int, peak: Dict[str, int], interval: float = 0.2) -> None:
+    while True:
+        peak["bytes"] = max(peak["bytes"], _process_tree_rss(pid))
+        await asyncio.sleep(interval)
+
+
+def _server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Parse 'stage;dur=12.3, other;dur=4' into {stage: milliseconds}."""
+    timings = {}
+    for metric in (header or "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            if name and param.startswith("dur="):
+                try:
+                    timings[name] = float(param[4:])
+                except ValueError:
+                    pass
+    return timings
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {"p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "mean": statistics.fmean(ordered), "max": ordered[-1]}
+
+
+async def run_phase(base_url: str, analysis: str, kinds: List[str], requests: int, concurrency: int,
+                    pages: int, warm: bool, first_seed: int = 0) -> dict:
+    """
+    Send `requests` documents for one analysis and collect their timings.
+    Unless `warm`, documents use seeds from `first_seed` on, so phases given
+    distinct seed ranges never hit the server's document cache.
+    """
+    documents = [make_document(kinds[i % len(kinds)], seed=first_seed if warm else first_seed + i, pages=pages)
+                 for i in range(requests)]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = defaultdict(list)
+    stages = defaultdict(list)
+    errors = defaultdict(int)
+
+    async def send(client: httpx.AsyncClient, i: int) -> None:
+        kind = kinds[i % len(kinds)]
+        filename, content = documents[i]
+        mime_type = MIME_TYPES[os.path.splitext(filename)[1]]
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{base_url}/analyze-content",
+                    data={**FORM, "analysis_type": analysis},
+                    files={"document": (filename, content, mime_type)},
+                )
+            except httpx.HTTPError:
+                errors[kind] += 1
+                return
+            elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            errors[kind] += 1
+            return
+        latencies[kind].append(elapsed * 1000)
+        for stage, milliseconds in _server_timing(response.headers.get("server-timing")).items():
+            stages[stage].append(milliseconds)
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=httpx.Timeout(600.0)) as client:
+        await asyncio.gather(*(send(client, i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    completed = sum(len(values) for values in latencies.values())
+    return {
+        "analysis": analysis,
+        "requests": requests,
+        "completed": completed,
+        "errors": dict(errors),
+        "seconds": elapsed,
+        "throughput_rps": completed / elapsed if elapsed else 0.0,
+        "latency_ms": {kind: percentiles(values) for kind, values in latencies.items()},
+        "stage_ms": {stage: percentiles(values) for stage, values in stages.items()},
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\nPeak RSS of the server: {report['peak_rss_bytes'] / 2 ** 20:.1f} MiB")
+    for phase in report["phases"]:
+        print(f"\n== {phase['analysis']}: {phase['completed']}/{phase['requests']} ok, "
+              f"{phase['throughput_rps']:.2f} req/s, errors {phase['errors'] or 0}")
+        for label, rows in (("kind", phase["latency_ms"]), ("stage", phase["stage_ms"])):
+            for name, stats in sorted(rows.items()):
+                print(f"  {label} {name:<24} p50 {stats['p50']:9.1f}  p90 {stats['p90']:9.1f}  "
+                      f"p99 {stats['p99']:9.1f}  max {stats['max']:9.1f} ms")
+
+
+async def main(args: argparse.Namespace) -> dict:
+    mock_port, server_port = _free_port(), _free_port()
+    mock_env = dict(os.environ,
+                    MOCK_LLM_LATENCY=str(args.llm_latency),
+                    MOCK_SEARCH_LATENCY=str(args.search_latency),
+                    MOCK_RATE_LIMIT=str(args.rate_limit),
+                    MOCK_STREAM_TOKENS_PER_SECOND=str(args.stream_tokens_per_second))
+    server_env = dict(os.environ,
+                      GROQ_BASE_URL=f"http://127.0.0.1:{mock_port}",
+                      GOOGLE_SEARCH_ENDPOINT=f"http://127.0.0.1:{mock_port}/",
+                      GROQ_RESTUDY_SUMMARY="bench", GROQ_RESTUDY_QUESTIONS="bench",
+                      GROQ_RESTUDY_MINDMAP="bench", GROQ_RESTUDY_RESOURCES="bench",
+                      GOOGLE_SEARCH_KEY="bench", GOOGLE_SEARCH_ID="bench",
+                      CACHE_BACKEND="memory",
+                      FUSED_ANALYSES="true" if args.fused else "false")
+
+    mock = _start("bench.mock_apis:app", mock_port, mock_env)
+    server = _start("server:app", server_port, server_env, workers=args.workers)
+    peak = {"bytes": 0}
+    sampler = None
+    try:
+        await _wait_until_up(f"http://127.0.0.1:{mock_port}/customsearch/v1?q=up", mock)
+        await _wait_until_up(f"http://127.0.0.1:{server_port}/", server)
+        sampler = asyncio.create_task(_sample_rss(server.pid, peak))
+        phases = []
+        for index, analysis in enumerate(args.analyses):
+            phases.append(await run_phase(f"http://127.0.0.1:{server_port}", analysis, args.kinds,
+                                          args.requests, args.concurrency, args.pages, args.warm,
+                                          first_seed=index * args.requests))
+    finally:
+        if sampler is not None:
+            sampler.cancel()
+        for process in (server, mock):
+            process.terminate()
+            process.wait(timeout=30)
+
+    return {"config": vars(args), "peak_rss_bytes": peak["bytes"], "phases": phases}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20, help="requests per analysis")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the server")
+    parser.add_argument("--analyses", default=",".join(ANALYSES),
+                        help="comma-separated analyses, each benchmarked separately; join with + to combine")
+    parser.add_argument("--kinds", default=",".join(KINDS), help="comma-separated fixture kinds")
+    parser.add_argument("--pages", type=int, default=4, help="pages per fixture document")
+    parser.add_argument("--warm", action="store_true", help="reuse one document per kind to measure cache hits")
+    parser.add_argument("--fused", action="store_true", help="run the server with FUSED_ANALYSES")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of LLM calls answered with 429")
+    parser.add_argument("--stream-tokens-per-second", type=float, default=300)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+    args.analyses = [analysis.replace("+", ",") for analysis in args.analyses.split(",") if analysis]
+    args.kinds = [kind for kind in args.kinds.split(",") if kind]
+    unknown = [kind for kind in args.kinds if kind not in KINDS]
+    if unknown:
+        parser.error(f"unknown fixture kinds: {', '.join(unknown)}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
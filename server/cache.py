@@ -0,0 +1,221 @@
+"""
+Key/value caches with TTL and LRU eviction.
+
+Two backends share the same get/set interface:
+
+- MemoryCache keeps entries in an OrderedDict local to one worker process,
+  optionally bounded by their total size as well as their number.
+- SQLiteCache stores entries in a SQLite file, so every uvicorn worker on the
+  host sees the same entries.
+
+make_cache picks a backend from the CACHE_BACKEND environment variable, or
+SQLite for caches that must be shared, and counts the cache's hits and
+misses. Values must be JSON serializable.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from metrics import record_cache_lookup
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_PATH = os.getenv('CACHE_PATH', 'restudy_cache.sqlite3')
+CACHE_TTL = float(os.getenv('CACHE_TTL', str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '2048'))
+# SQLite reads only record their access time when the stored one is older than
+# this, so hot entries don't take the write lock on every read
+CACHE_TOUCH_SECONDS = float(os.getenv('CACHE_TOUCH_SECONDS', '300'))
+
+
+def _size(value: Any) -> int:
+    # Approximate: characters of the value, or of its JSON form
+    return len(value) if isinstance(value, str) else len(json.dumps(value))
+
+
+def hash_text(text: str) -> str:
+    """Return the SHA-256 hex digest of a text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def make_key(*parts: Any) -> str:
+    """Build a cache key from a sequence of JSON serializable parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    """
+    An in-process LRU cache whose entries expire after a TTL.
+
+    With max_bytes set, least recently used entries are also evicted once the
+    entries' approximate total size goes over it.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL,
+                 max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _pop(self, key: Optional[str] = None) -> None:
+        if key is None:
+            _, (_, _, size) = self._entries.popitem(last=False)
+        else:
+            _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        size = _size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Would evict everything else and still not fit
+            self.delete(key)
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._pop()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+
+class SQLiteCache:
+    """
+    A cache stored in a SQLite table, safe to share between processes.
+
+    Entries expire after a TTL. When the table grows past max_entries, the
+    least recently read entries are evicted. Read times are kept to within
+    CACHE_TOUCH_SECONDS.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, namespace: str = 'cache',
+                 max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.path = path
+        self.table = ''.join(c if c.isalnum() else '_' for c in namespace)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[Any]:
+        connection = self._connect()
+        now = time.time()
+        row = connection.execute(
+            f"SELECT value, expires_at, accessed_at FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        if expires_at < now:
+            connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            return None
+        if now - accessed_at > CACHE_TOUCH_SECONDS:
+            connection.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        connection = self._connect()
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), expires_at, now),
+        )
+        connection.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+        connection.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, key: str) -> None:
+        self._connect().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+
+class CountingCache:
+    """
+    Wraps a cache backend, counting lookups by namespace and result.
+    """
+
+    def __init__(self, backend, namespace: str):
+        self.backend = backend
+        self.namespace = namespace
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.backend.get(key)
+        record_cache_lookup(self.namespace, value is not None)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.backend.set(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.backend.delete(key)
+
+
+def make_cache(namespace: str, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL,
+               max_bytes: Optional[int] = None, shared: bool = False):
+    """
+    Create a cache for one kind of entry.
+
+    Args:
+        namespace: Name separating these entries from other caches (a table name for SQLite)
+        max_entries: Maximum number of entries kept before LRU eviction
+        ttl: Seconds an entry stays valid
+        max_bytes: Approximate size limit of the memory backend, which lives in each worker's RSS.
+            The SQLite backend is on disk and only limits entries.
+        shared: Use the SQLite backend whatever CACHE_BACKEND says, for entries every
+            worker must see, such as IDs handed to clients
+
+    Returns:
+        A MemoryCache or SQLiteCache, depending on CACHE_BACKEND, wrapped in a CountingCache
+    """
+    if shared or CACHE_BACKEND == 'sqlite':
+        backend = SQLiteCache(CACHE_PATH, namespace=namespace, max_entries=max_entries, ttl=ttl)
+    elif CACHE_BACKEND == 'memory':
+        backend = MemoryCache(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
+    return CountingCache(backend, namespace)
@@ -0,0 +1,179 @@
+"""
+Token-aware chunking and map-reduce helpers for long documents.
+
+Documents that don't fit in one prompt are split on page and paragraph
+boundaries into chunks of at most CHUNK_TOKENS estimated tokens. Each chunk is
+analysed separately, with at most CHUNK_CONCURRENCY LLM calls in flight, and the
+partial results are merged by the reduce helpers below.
+"""
+
+import asyncio
+import math
+import os
+import re
+from typing import Any, Awaitable, Callable, Dict, List
+
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '6000'))
+CHUNK_CONCURRENCY = int(os.getenv('CHUNK_CONCURRENCY', '4'))
+
+# Rough average for English and Spanish text with the Llama tokenizers
+CHARS_PER_TOKEN = 4
+
+PAGE_BREAK = re.compile(r'\f')
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _split_oversized(text: str, max_chars: int) -> List[str]:
+    # Paragraphs too long for one chunk are split on sentences, then cut hard
+    pieces = []
+    for sentence in SENTENCE_BREAK.split(text):
+        while len(sentence) > max_chars:
+            pieces.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        pieces.append(sentence)
+    return pieces
+
+
+def split_into_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Split a text into chunks of at most max_tokens estimated tokens.
+
+    Args:
+        text: The text to split
+        max_tokens: Token budget per chunk
+
+    Returns:
+        The chunks in document order. Short texts come back as a single chunk.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return [text]
+
+    pieces = []
+    for page in PAGE_BREAK.split(text):
+        for paragraph in PARAGRAPH_BREAK.split(page):
+            if len(paragraph) > max_chars:
+                pieces.extend(_split_oversized(paragraph, max_chars))
+            elif paragraph.strip():
+                pieces.append(paragraph)
+
+    chunks, current, current_len = [], [], 0
+    for piece in pieces:
+        if current and current_len + len(piece) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current, current_len = [], 0
+        current.append(piece)
+        current_len += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def pick_evenly(items: List[Any], count: int) -> List[Any]:
+    """Pick up to `count` items spread evenly from first to last, in order."""
+    if count >= len(items):
+        return list(items)
+    if count <= 1:
+        return list(items[:count])
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
+
+
+def sample_text(text: str, max_tokens: int) -> str:
+    """
+    Pick chunks spread evenly across a text so the result fits in max_tokens.
+    Unlike truncation, the end of the document is represented too.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    chunks = split_into_chunks(text, max(1, max_tokens // 8))
+    keep = max(1, min(len(chunks), max_tokens * CHARS_PER_TOKEN // max(1, max(len(c) for c in chunks))))
+    return "\n\n".join(pick_evenly(chunks, keep))
+
+
+async def map_chunks(chunks: List[str], analyse: Callable[[str], Awaitable[Any]],
+                     concurrency: int = CHUNK_CONCURRENCY) -> List[Any]:
+    """
+    Run analyse on every chunk with at most `concurrency` calls in flight.
+
+    Returns:
+        One result per chunk, in order. Exceptions are returned in place of results.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(chunk: str):
+        async with semaphore:
+            return await analyse(chunk)
+
+    return await asyncio.gather(*(run(chunk) for chunk in chunks), return_exceptions=True)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\W+', ' ', text).strip().lower()
+
+
+def merge_questions(partials: List[Dict[str, List[str]]], question_number: int) -> Dict[str, List[str]]:
+    """
+    Merge per-chunk question sets, dropping duplicates and taking questions
+    round-robin from every chunk. Callers with more chunks than questions
+    should pick_evenly from the chunks first, or the quota fills up from the
+    first chunks only.
+    """
+    seen = set()
+    merged = {"questions": [], "answers": []}
+    queues = [list(zip(partial["questions"], partial["answers"])) for partial in partials]
+    while len(merged["questions"]) < question_number and any(queues):
+        for queue in queues:
+            if not queue or len(merged["questions"]) >= question_number:
+                continue
+            question, answer = queue.pop(0)
+            key = _normalize(question)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged["questions"].append(question)
+            merged["answers"].append(answer)
+    return merged
+
+
+def _merge_subcategories(target: List[Dict], extra: List[Dict], limit: int) -> None:
+    by_text = {_normalize(item['text']): item for item in target}
+    for item in extra:
+        existing = by_text.get(_normalize(item['text']))
+        if existing is not None:
+            existing.setdefault('subcategories', [])
+            _merge_subcategories(existing['subcategories'], item.get('subcategories') or [], limit)
+        elif len(target) < limit:
+            target.append(item)
+            by_text[_normalize(item['text'])] = item
+
+
+def merge_mind_maps(partials: List[Dict], max_categories: int = 5, max_subcategories: int = 3) -> Dict:
+    """
+    Merge per-chunk mind maps into one. Categories with the same title are
+    combined, and the categories that recur across the most chunks are kept.
+    """
+    categories: Dict[str, Dict] = {}
+    occurrences: Dict[str, int] = {}
+    for partial in partials:
+        for category in partial['categories']:
+            key = _normalize(category['text'])
+            occurrences[key] = occurrences.get(key, 0) + 1
+            if key in categories:
+                categories[key].setdefault('subcategories', [])
+                _merge_subcategories(categories[key]['subcategories'], category.get('subcategories') or [], max_subcategories)
+            else:
+                categories[key] = category
+
+    # sorted() is stable, so ties keep document order
+    ranked = sorted(categories, key=lambda key: -occurrences[key])[:max_categories]
+    return {
+        'title': partials[0]['title'],
+        'categories': [categories[key] for key in ranked],
+    }
@@ -0,0 +1,331 @@
+"""
+Page-level document extraction pipeline.
+
+PDF parsing, rasterization and OCR are CPU bound and would block the event loop
+if run inside an endpoint. PDFs are split into page ranges that are fanned out
+to process pools: a text lane extracts the text layer of every page and
+fingerprints the pages without one. OCR output is cached per page
+fingerprint, so only the scanned pages that miss the cache are rasterized and
+handed to a separate OCR lane, and revised documents only render and OCR the
+pages that changed. The OCR lane is a local process pool, or the host's OCR
+sidecar when OCR_SIDECAR is enabled. Page images cross process boundaries
+PNG-encoded. Results are reassembled in page order.
+"""
+
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Tuple, Union
+
+from cache import make_cache, make_key
+from metrics import OCR_PAGES, span
+from ocr import OCR_LANGUAGES
+from ocr_service import OCR_SIDECAR, SidecarUnavailable, sidecar_client
+
+EXTRACT_TEXT_WORKERS = int(os.getenv('EXTRACT_TEXT_WORKERS', '2'))
+EXTRACT_OCR_WORKERS = int(os.getenv('EXTRACT_OCR_WORKERS', '1'))
+EXTRACT_PAGES_PER_TASK = int(os.getenv('EXTRACT_PAGES_PER_TASK', '16'))
+# Scanned pages are rendered so their longer side is about OCR_TARGET_PIXELS,
+# within [OCR_MIN_DPI, OCR_MAX_DPI]
+OCR_TARGET_PIXELS = int(os.getenv('OCR_TARGET_PIXELS', '2000'))
+OCR_MIN_DPI = int(os.getenv('OCR_MIN_DPI', '100'))
+OCR_MAX_DPI = int(os.getenv('OCR_MAX_DPI', '300'))
+# Pages with less than this fraction of ink in their preview are skipped as blank
+OCR_MIN_INK = float(os.getenv('OCR_MIN_INK', '0.002'))
+PREVIEW_DPI = 36
+# Gray levels a pixel must differ from the page background to count as ink
+INK_CONTRAST = 48
+# Margin kept around the content when cropping, in points
+CROP_MARGIN = 12
+# Size limit of the in-memory page cache, per worker
+PAGE_CACHE_BYTES = int(os.getenv('PAGE_CACHE_BYTES', str(16 * 2 ** 20)))
+
+_text_pool: Optional[ProcessPoolExecutor] = None
+_ocr_pool: Optional[ProcessPoolExecutor] = None
+_pools_lock = threading.Lock()
+
+# OCR output of scanned pages, keyed by page fingerprint and language set
+page_cache = make_cache('pages', max_bytes=PAGE_CACHE_BYTES)
+
+
+def _get_text_pool() -> ProcessPoolExecutor:
+    global _text_pool
+    with _pools_lock:
+        if _text_pool is None:
+            # spawn keeps forked children from inheriting the server's threads and sockets
+            _text_pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_TEXT_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _text_pool
+
+
+def _get_ocr_pool() -> ProcessPoolExecutor:
+    global _ocr_pool
+    with _pools_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_OCR_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _ocr_pool
+
+
+def shutdown_pools() -> None:
+    """Stop the extraction worker processes."""
+    global _text_pool, _ocr_pool
+    with _pools_lock:
+        for pool in (_text_pool, _ocr_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        _text_pool = None
+        _ocr_pool = None
+
+
+class PdfDocument:
+    """
+    A PDF parsed once with PyMuPDF, offering per-page text and raster access
+    from the same handle.
+    """
+
+    def __init__(self, source: Union[bytes, bytearray, str]):
+        import fitz
+        if isinstance(source, str):
+            self._document = fitz.open(source, filetype="pdf")
+        else:
+            self._document = fitz.open(stream=source, filetype="pdf")
+
+    def __len__(self) -> int:
+        return self._document.page_count
+
+    def __enter__(self) -> "PdfDocument":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._document.close()
+
+    def page_text(self, page_num: int) -> str:
+        """Return the text layer of a page, or an empty string for scanned pages."""
+        return self._document.load_page(page_num).get_text()
+
+    def page_fingerprint(self, page_num: int) -> str:
+        """
+        Hash what a page draws: its content stream and the raw data of its
+        images. Identical pages in different files share a fingerprint.
+        """
+        page = self._document.load_page(page_num)
+        digest = hashlib.sha256(page.read_contents())
+        for image in page.get_images(full=True):
+            digest.update(self._document.xref_stream_raw(image[0]) or b'')
+        digest.update(repr(tuple(page.rect)).encode('utf-8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _render_gray(page, dpi: int, clip=None):
+        import fitz
+        import numpy as np
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False, clip=clip)
+        # Rows may be padded past the image width
+        samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)
+        return samples[:, :pix.width]
+
+    def page_image(self, page_num: int):
+        """
+        Rasterize a page for OCR as a grayscale NumPy array, cropped to its
+        content. A low-resolution preview locates the content first; the DPI
+        of the final render follows the page size.
+
+        Returns:
+            The page image, or None if the page is blank
+        """
+        import fitz
+        import numpy as np
+        page = self._document.load_page(page_num)
+
+        preview = self._render_gray(page, PREVIEW_DPI)
+        if preview.size == 0:
+            return None
+        background = np.median(preview)
+        ink = np.abs(preview.astype(np.int16) - int(background)) > INK_CONTRAST
+        if ink.mean() < OCR_MIN_INK:
+            return None
+
+        clip = None
+        if page.rotation == 0:
+            rows = np.flatnonzero(ink.any(axis=1))
+            cols = np.flatnonzero(ink.any(axis=0))
+            scale = 72 / PREVIEW_DPI
+            rect = page.rect
+            clip = fitz.Rect(
+                rect.x0 + cols[0] * scale - CROP_MARGIN, rect.y0 + rows[0] * scale - CROP_MARGIN,
+                rect.x0 + (cols[-1] + 1) * scale + CROP_MARGIN, rect.y0 + (rows[-1] + 1) * scale + CROP_MARGIN,
+            ) & rect
+
+        long_side_inches = max(page.rect.width, page.rect.height) / 72
+        dpi = int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, OCR_TARGET_PIXELS / max(long_side_inches, 1e-3))))
+        return np.ascontiguousarray(self._render_gray(page, dpi, clip))
+
+
+# Worker functions. These run in the pool processes and must stay importable
+# at module level so they can be pickled.
+
+def _count_pages(source: Union[bytes, bytearray, str]) -> int:
+    with PdfDocument(source) as pdf_document:
+        return len(pdf_document)
+
+
+def _extract_text_pages(source: Union[bytes, bytearray, str], start: int, stop: int) -> Tuple[List[str], List[int], List[str]]:
+    """
+    Extract the text layer of pages [start, stop). Pages without one are
+    fingerprinted, so their cached OCR output can be found before anything
+    is rendered.
+    """
+    page_texts, scanned_pages, fingerprints = [], [], []
+    with PdfDocument(source) as pdf_document:
+        for page_num in range(start, stop):
+            page_text = pdf_document.page_text(page_num)
+            if not page_text.strip():
+                scanned_pages.append(page_num)
+                fingerprints.append(pdf_document.page_fingerprint(page_num))
+            page_texts.append(page_text)
+    return page_texts, scanned_pages, fingerprints
+
+
+def _render_pages(source: Union[bytes, bytearray, str], page_nums: List[int]) -> List[Optional[bytes]]:
+    """Rasterize pages for OCR, PNG-encoded so the OCR lane never parses the PDF. Blank pages give None."""
+    from ocr import encode_image
+    images = []
+    with PdfDocument(source) as pdf_document:
+        for page_num in page_nums:
+            image = pdf_document.page_image(page_num)
+            images.append(encode_image(image) if image is not None else None)
+    return images
+
+
+def _ocr_pages(images: List[bytes]) -> List[str]:
+    from ocr import decode_image, ocr_images
+    return ocr_images([decode_image(image) for image in images])
+
+
+def _warm_text_worker() -> None:
+    import fitz
+    import docx
+
+
+def _warm_ocr_worker() -> None:
+    from ocr import get_ocr_pool
+    get_ocr_pool().warm_up()
+
+
+def _extract_docx_text(source: Union[bytes, bytearray, str]) -> str:
+    from docx import Document
+    document = Document(source if isinstance(source, str) else io.BytesIO(source))
+    return "".join(paragraph.text + "\n" for paragraph in document.paragraphs)
+
+
+async def _recognize(images: List[bytes]) -> List[str]:
+    """OCR encoded page images in the sidecar if enabled, else in the local OCR pool."""
+    loop = asyncio.get_running_loop()
+    if OCR_SIDECAR:
+        try:
+            return await loop.run_in_executor(None, sidecar_client.readtext, images)
+        except SidecarUnavailable as e:
+            print(f"{e}; running OCR in this worker")
+    return await loop.run_in_executor(_get_ocr_pool(), _ocr_pages, images)
+
+
+async def extract_pdf_text(source: Union[bytes, bytearray, str],
+                           on_pages: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Extract the text of a PDF without blocking the event loop.
+
+    Args:
+        source: The PDF's bytes, or the path of a spooled upload. Large uploads
+            should be passed by path so workers open the file instead of
+            receiving a pickled copy.
+        on_pages: Called with (pages done, page count) as page ranges finish
+
+    Returns:
+        The text of every page, in page order, separated by form feeds. Pages
+        without a text layer are OCR'd.
+    """
+    loop = asyncio.get_running_loop()
+    text_pool = _get_text_pool()
+    page_count = await loop.run_in_executor(text_pool, _count_pages, source)
+    pages_done = 0
+
+    async def extract_range(start: int, stop: int) -> List[str]:
+        page_texts, scanned_pages, fingerprints = await loop.run_in_executor(
+            text_pool, _extract_text_pages, source, start, stop
+        )
+
+        # Reuse the OCR output of pages already seen in any earlier upload
+        missing = []
+        for page_num, fingerprint in zip(scanned_pages, fingerprints):
+            cached = page_cache.get(make_key('page', fingerprint, OCR_LANGUAGES))
+            if cached is None:
+                missing.append((page_num, fingerprint))
+            else:
+                page_texts[page_num - start] = cached
+        OCR_PAGES.labels('cache').inc(len(scanned_pages) - len(missing))
+
+        if missing:
+            # Only the pages that missed the cache are rendered
+            images = await loop.run_in_executor(text_pool, _render_pages, source, [page_num for page_num, _ in missing])
+            to_recognize = []
+            for (page_num, fingerprint), image in zip(missing, images):
+                if image is None:
+                    # Cached as empty text, so a blank page isn't rendered again either
+                    page_cache.set(make_key('page', fingerprint, OCR_LANGUAGES), "")
+                else:
+                    to_recognize.append((page_num, fingerprint, image))
+            OCR_PAGES.labels('blank').inc(len(missing) - len(to_recognize))
+
+            if to_recognize:
+                with span("ocr"):
+                    ocr_texts = await _recognize([image for _, _, image in to_recognize])
+                OCR_PAGES.labels('ocr').inc(len(to_recognize))
+                for (page_num, fingerprint, _), ocr_text in zip(to_recognize, ocr_texts):
+                    page_texts[page_num - start] = ocr_text
+                    page_cache.set(make_key('page', fingerprint, OCR_LANGUAGES), ocr_text)
+
+        nonlocal pages_done
+        pages_done += stop - start
+        if on_pages is not None:
+            on_pages(pages_done, page_count)
+        return page_texts
+
+    step = max(1, EXTRACT_PAGES_PER_TASK)
+    ranges = await asyncio.gather(*(
+        extract_range(start, min(start + step, page_count)) for start in range(0, page_count, step)
+    ))
+    # Form feeds keep page boundaries for normalization and chunking
+    return "\f".join(text for page_texts in ranges for text in page_texts)
+
+
+async def extract_docx_text(source: Union[bytes, bytearray, str]) -> str:
+    """Extract the paragraphs of a DOCX file, given as bytes or a path, without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_text_pool(), _extract_docx_text, source)
+
+
+async def warm_up() -> None:
+    """Start the text workers and load the parsing libraries in each of them."""
+    loop = asyncio.get_running_loop()
+    text_pool = _get_text_pool()
+    await asyncio.gather(*(loop.run_in_executor(text_pool, _warm_text_worker) for _ in range(EXTRACT_TEXT_WORKERS)))
+
+
+async def warm_up_ocr() -> None:
+    """Start the OCR workers and load the OCR models in each of them, or in the sidecar."""
+    loop = asyncio.get_running_loop()
+    if OCR_SIDECAR:
+        await loop.run_in_executor(None, sidecar_client.warm_up)
+        return
+    ocr_pool = _get_ocr_pool()
+    await asyncio.gather(*(loop.run_in_executor(ocr_pool, _warm_ocr_worker) for _ in range(EXTRACT_OCR_WORKERS)))
@@ -0,0 +1,291 @@
+"""
+Durable background jobs.
+
+Long documents can be submitted as jobs instead of being analyzed while the
+HTTP request waits. Jobs are stored in a SQLite queue shared by every uvicorn
+worker on the host, and their documents are kept in JOBS_DIR until they
+finish. Each worker runs JOB_WORKERS job loops that claim queued jobs. A
+claim is a lease that the running loop renews; if its worker dies, the lease
+runs out and another worker picks the job up again, up to JOB_MAX_ATTEMPTS
+times, so a job that keeps killing its worker fails instead of taking every
+worker down in turn.
+
+Jobs report progress (pages extracted, analyses done) and partial results as
+they go, so clients can poll them or follow them over a WebSocket. Store
+calls run in threads so a busy queue database never blocks the event loop.
+"""
+
+import asyncio
+import copy
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+JOBS_PATH = os.getenv('JOBS_PATH', 'restudy_jobs.sqlite3')
+JOBS_DIR = os.getenv('JOBS_DIR', os.path.join(tempfile.gettempdir(), 'restudy-jobs'))
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# Finished jobs are kept this long for clients to collect their results
+JOB_RETENTION = float(os.getenv('JOB_RETENTION', str(24 * 3600)))
+JOB_POLL_SECONDS = 0.5
+
+FINISHED = ('done', 'failed')
+CLAIMABLE = "status = 'queued' OR (status = 'running' AND lease_expires_at < ?)"
+
+
+class JobStore:
+    """
+    The job table. Status moves from queued to running to done or failed;
+    running jobs whose lease has expired count as queued again.
+    """
+
+    def __init__(self, path: str = JOBS_PATH, documents_dir: str = JOBS_DIR, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.documents_dir = documents_dir
+        self.max_attempts = max(1, max_attempts)
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, document_path TEXT, "
+                "progress TEXT NOT NULL, results TEXT NOT NULL, error TEXT, attempts INTEGER NOT NULL, "
+                "lease_expires_at REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def document_path(self, job_id: str, extension: str) -> str:
+        """Where a job's document is kept until the job finishes."""
+        os.makedirs(self.documents_dir, exist_ok=True)
+        return os.path.join(self.documents_dir, job_id + extension)
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def create(self, job_id: str, params: Dict[str, Any], document_path: Optional[str] = None) -> None:
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, params, document_path, progress, results, attempts, created_at, updated_at) "
+            "VALUES (?, 'queued', ?, ?, '{}', '{}', 0, ?, ?)",
+            (job_id, json.dumps(params), document_path, now, now),
+        )
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest queued job, or one whose lease has expired. Jobs whose
+        workers have already died max_attempts times are marked failed instead.
+        """
+        connection = self._connect()
+        now = time.time()
+        # Idle loops poll often: only take the write lock when there's something to claim
+        if connection.execute(f"SELECT 1 FROM jobs WHERE {CLAIMABLE} LIMIT 1", (now,)).fetchone() is None:
+            return None
+        abandoned = []
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = connection.execute(
+                    f"SELECT * FROM jobs WHERE {CLAIMABLE} ORDER BY created_at LIMIT 1", (now,)
+                ).fetchone()
+                if row is None or row['attempts'] < self.max_attempts:
+                    break
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                    (f"Gave up after {row['attempts']} attempts: the job's worker stopped each time", now, row['id'])
+                )
+                abandoned.append(row['document_path'])
+            if row is not None:
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_expires_at = ?, updated_at = ? "
+                    "WHERE id = ?", (now + JOB_LEASE_SECONDS, now, row['id'])
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        for document_path in abandoned:
+            self._remove_document(document_path)
+        return self._to_dict(row) if row is not None else None
+
+    def renew(self, job_id: str) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = 'running'",
+            (time.time() + JOB_LEASE_SECONDS, job_id),
+        )
+
+    def release(self, job_id: str) -> None:
+        """
+        Put a running job back in the queue, e.g. when its worker shuts down.
+        A clean hand-off doesn't count as an attempt.
+        """
+        self._connect().execute(
+            "UPDATE jobs SET status = 'queued', attempts = MAX(attempts - 1, 0), lease_expires_at = NULL, "
+            "updated_at = ? WHERE id = ? AND status = 'running'",
+            (time.time(), job_id),
+        )
+
+    def update(self, job_id: str, progress: Dict[str, Any], results: Dict[str, Any]) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET progress = ?, results = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(progress), json.dumps(results), time.time(), job_id),
+        )
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        """Mark a job done, or failed with `error`, and delete its document."""
+        connection = self._connect()
+        row = connection.execute("SELECT document_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        connection.execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+            ('failed' if error is not None else 'done', error, time.time(), job_id),
+        )
+        if row is not None:
+            self._remove_document(row['document_path'])
+
+    @staticmethod
+    def _remove_document(document_path: Optional[str]) -> None:
+        if document_path:
+            try:
+                os.remove(document_path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def purge(self) -> None:
+        """Delete finished jobs older than JOB_RETENTION."""
+        self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (time.time() - JOB_RETENTION,)
+        )
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for field in ('params', 'progress', 'results'):
+            job[field] = json.loads(job[field])
+        return job
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a job returned to clients."""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "results": job["results"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+class JobProgress:
+    """
+    Progress and partial results of a running job, written through to the
+    store on every change. Writes happen in the background one at a time, so
+    they land in order and changes made during a write are saved together by
+    the next one; `flush` waits for them.
+    """
+
+    def __init__(self, store: JobStore, job_id: str, results: Optional[Dict[str, Any]] = None):
+        self.store = store
+        self.job_id = job_id
+        self.progress: Dict[str, Any] = {"pages_done": 0, "pages_total": None, "analyses": {}}
+        self.results: Dict[str, Any] = dict(results or {})
+        self._dirty = False
+        self._writer: Optional[asyncio.Task] = None
+
+    def _save(self) -> None:
+        self._dirty = True
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.get_running_loop().create_task(self._write())
+
+    async def _write(self) -> None:
+        while self._dirty:
+            self._dirty = False
+            progress, results = copy.deepcopy((self.progress, self.results))
+            await asyncio.to_thread(self.store.update, self.job_id, progress, results)
+
+    async def flush(self) -> None:
+        """Wait until every change so far is in the store."""
+        if self._writer is not None:
+            await self._writer
+
+    def pages(self, done: int, total: int) -> None:
+        self.progress["pages_done"] = done
+        self.progress["pages_total"] = total
+        self._save()
+
+    def analyses(self, names: List[str]) -> None:
+        self.progress["analyses"] = {name: "running" for name in names}
+        self._save()
+
+    def analysis_done(self, name: str, fields: Dict[str, Any]) -> None:
+        self.progress["analyses"][name] = "done"
+        self.results.update(fields)
+        self._save()
+
+    def analysis_failed(self, name: str, error: str) -> None:
+        self.progress["analyses"][name] = "failed"
+        self.results.setdefault("errors", {})[name] = error
+        self._save()
+
+
+JobHandler = Callable[[Dict[str, Any], JobProgress], Awaitable[None]]
+
+
+async def _keep_lease(store: JobStore, job_id: str) -> None:
+    while True:
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+        await asyncio.to_thread(store.renew, job_id)
+
+
+async def job_loop(store: JobStore, handler: JobHandler) -> None:
+    """Claim and run jobs one at a time until cancelled."""
+    while True:
+        job = await asyncio.to_thread(store.claim)
+        if job is None:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+
+        lease = asyncio.create_task(_keep_lease(store, job["id"]))
+        progress = JobProgress(store, job["id"], job["results"])
+        try:
+            await handler(job, progress)
+            await progress.flush()
+            await asyncio.to_thread(store.finish, job["id"])
+        except asyncio.CancelledError:
+            # The worker is shutting down: let another one take over right away
+            await asyncio.to_thread(store.release, job["id"])
+            raise
+        except Exception as e:
+            print(f"Job {job['id']} failed: {e!r}")
+            try:
+                await progress.flush()
+            except Exception:
+                pass
+            await asyncio.to_thread(store.finish, job["id"], error=str(e) or repr(e))
+        finally:
+            lease.cancel()
+
+
+def start_job_workers(store: JobStore, handler: JobHandler, count: int = JOB_WORKERS) -> List[asyncio.Task]:
+    """Start `count` job loops in this worker process."""
+    store.purge()
+    return [asyncio.create_task(job_loop(store, handler)) for _ in range(count)]
@@ -0,0 +1,138 @@
+"""
+Local keyphrase extraction with TextRank.
+
+Candidate words (tokens that aren't stopwords or numbers) become nodes of a
+co-occurrence graph, linked when they appear within WINDOW tokens of each
+other. Word scores come from PageRank over that graph, computed with
+vectorized NumPy power iteration on an edge list, so time and memory grow
+linearly with the text. Keyphrases are runs of adjacent candidate words,
+scored by the sum of their words' scores.
+
+This runs in milliseconds and needs no API call, so it can produce search
+phrases on its own or stand in when the LLM is unavailable.
+"""
+
+import re
+from collections import Counter
+from typing import List, Tuple
+
+import numpy as np
+
+WINDOW = 4
+DAMPING = 0.85
+ITERATIONS = 30
+MAX_PHRASE_WORDS = 3
+# Least frequent words beyond this vocabulary size are dropped from the graph
+MAX_VOCABULARY = 5000
+
+TOKEN = re.compile(r"\w+(?:['’]\w+)?|[^\w\s]")
+
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each either else even ever every few for from
+further had has have having he her here hers herself him himself his how however i if in into is it its
+itself just least less like made make many may me might more most much must my myself neither no nor not
+now of off often on once one only or other others otherwise our ours ourselves out over own per perhaps
+quite rather really same say says see seen several shall she should since so some such than that the their
+theirs them themselves then there these they this those though through thus to too toward towards under
+until up upon us use used using very via was we well were what whatever when where whether which while who
+whom whose why will with within without would yet you your yours yourself yourselves
+al algo algunas algunos ante antes aquel aquella aquellas aquellos aqui así aun aunque cada como con
+contra cual cuales cuando de del desde donde dos durante el ella ellas ellos en entre era eran es esa esas
+ese eso esos esta estaba estaban estado estar estas este esto estos fue fueron ha había habían han hasta
+hay la las le les lo los más me mi mis mismo mucho muy nada ni no nos nosotros o otra otras otro otros
+para pero poco por porque puede pueden que quien quienes se sea según ser si sido siempre sin sino sobre
+su sus también tan tanto te tiene tienen todo todos tu tus un una unas uno unos usted ustedes y ya yo
+""".split())
+
+
+def _is_candidate(token: str) -> bool:
+    return len(token) > 2 and token.isalpha() and token not in STOPWORDS
+
+
+def _candidate_runs(text: str) -> List[List[str]]:
+    """Split the text into runs of adjacent candidate words."""
+    runs, current = [], []
+    for token in TOKEN.findall(text.lower()):
+        if _is_candidate(token):
+            current.append(token)
+        elif current:
+            runs.append(current)
+            current = []
+    if current:
+        runs.append(current)
+    return runs
+
+
+def _textrank(runs: List[List[str]]) -> dict:
+    frequency = Counter(word for run in runs for word in run)
+    vocabulary = {word: i for i, (word, _) in enumerate(frequency.most_common(MAX_VOCABULARY))}
+    if not vocabulary:
+        return {}
+
+    # Co-occurrence edges between candidate words within WINDOW of each other
+    sequence = np.fromiter(
+        (vocabulary.get(word, -1) for run in runs for word in run), dtype=np.int64
+    )
+    sources, targets = [], []
+    for offset in range(1, WINDOW):
+        a, b = sequence[:-offset], sequence[offset:]
+        keep = (a >= 0) & (b >= 0) & (a != b)
+        sources.append(a[keep])
+        targets.append(b[keep])
+    source = np.concatenate(sources + targets)
+    target = np.concatenate(targets + sources)
+
+    size = len(vocabulary)
+    scores = np.ones(size)
+    if source.size:
+        out_degree = np.bincount(source, minlength=size).astype(float)
+        weight = 1.0 / out_degree[source]
+        for _ in range(ITERATIONS):
+            scores = (1 - DAMPING) + DAMPING * np.bincount(target, weights=weight * scores[source], minlength=size)
+
+    return {word: float(scores[i]) for word, i in vocabulary.items()}
+
+
+def extract_keyphrases(text: str, top_n: int = 10) -> List[Tuple[str, float]]:
+    """
+    Extract the highest-scoring keyphrases of a text.
+
+    Args:
+        text: The text to analyze
+        top_n: Number of keyphrases to return
+
+    Returns:
+        (phrase, score) pairs, best first
+    """
+    runs = _candidate_runs(text)
+    word_scores = _textrank(runs)
+    if not word_scores:
+        return []
+
+    phrases = {}
+    for run in runs:
+        # Long runs are cut into phrases of at most MAX_PHRASE_WORDS words
+        for start in range(0, len(run), MAX_PHRASE_WORDS):
+            words = run[start:start + MAX_PHRASE_WORDS]
+            phrase = " ".join(words)
+            if phrase not in phrases:
+                phrases[phrase] = sum(word_scores.get(word, 0.0) for word in words)
+
+    ranked = sorted(phrases.items(), key=lambda item: item[1], reverse=True)
+    return ranked[:top_n]
+
+
+def keyphrase_search_queries(text: str, count: int = 1, max_words: int = 8) -> List[str]:
+    """
+    Build search queries from the top keyphrases, spreading different
+    keyphrases across queries and avoiding repeated words within a query.
+    """
+    keyphrases = extract_keyphrases(text, top_n=count * 6)
+    queries = [[] for _ in range(max(1, count))]
+    for i, (phrase, _) in enumerate(keyphrases):
+        query = queries[i % len(queries)]
+        words = [word for word in phrase.split() if word not in query]
+        if words and len(query) + len(words) <= max_words:
+            query.extend(words)
+    return [" ".join(query) for query in queries if query]
@@ -0,0 +1,335 @@
+"""
+Rate-limit-aware scheduler for Groq chat completions.
+
+Every LLM call in the server goes through one LLMScheduler, which
+
+- admits at most LLM_MAX_IN_FLIGHT calls at a time, serving waiting calls in
+  priority order (the summary first, resources last); calls backing off from
+  a rate limit give up their slot while they sleep,
+- keeps a token bucket per API key and model, refilled from the
+  x-ratelimit-* and retry-after headers Groq returns with every response,
+- waits for capacity with jittered backoff when it is due back soon, and
+  otherwise falls through an ordered list of fallback models,
+- counts requests, rate limits, fallbacks and queue wait per analysis, and
+  exports them with request durations and token counts to Prometheus.
+"""
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import os
+import random
+import re
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import groq
+import httpx
+from groq import AsyncGroq
+
+from chunking import estimate_tokens
+from metrics import LLM_FALLBACKS, LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_TOKENS, span
+
+GROQ_MODELS = [model.strip() for model in os.getenv(
+    'GROQ_MODELS', 'llama-3.3-70b-versatile,meta-llama/llama-4-scout-17b-16e-instruct,llama-3.1-8b-instant'
+).split(',') if model.strip()]
+GROQ_MAX_CONNECTIONS = int(os.getenv('GROQ_MAX_CONNECTIONS', '20'))
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '8'))
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+# Longest we'll wait for a model's limits to reset before moving to the next tier
+LLM_MAX_WAIT = float(os.getenv('LLM_MAX_WAIT', '10'))
+LLM_BACKOFF_BASE = 0.5
+
+PRIORITIES = {"summary": 0, "questions": 1, "mindmap": 2, "resources": 3}
+DEFAULT_PRIORITY = 4
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse Groq reset durations such as '7.66s', '2m59.56s' or '300ms' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _is_json_validation_error(error: Exception) -> bool:
+    body = getattr(error, 'body', None)
+    if isinstance(body, dict):
+        body = body.get('error', body)
+    return isinstance(body, dict) and body.get('code') == 'json_validate_failed'
+
+
+class TokenBucket:
+    """
+    What we know about one API key's limits on one model. Remaining counts come
+    from the latest response headers and are decremented locally between
+    responses.
+    """
+
+    def __init__(self):
+        self.remaining_requests: Optional[int] = None
+        self.remaining_tokens: Optional[int] = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.blocked_until = 0.0
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        """Seconds until a call of `tokens` tokens fits within the known limits."""
+        wait = max(0.0, self.blocked_until - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens and self.tokens_reset_at > now:
+            wait = max(wait, self.tokens_reset_at - now)
+        if self.remaining_requests is not None and self.remaining_requests < 1 and self.requests_reset_at > now:
+            wait = max(wait, self.requests_reset_at - now)
+        return wait
+
+    def reserve(self, tokens: int, now: float) -> None:
+        if self.remaining_requests is not None:
+            self.remaining_requests = self.remaining_requests - 1 if self.requests_reset_at > now else None
+        if self.remaining_tokens is not None:
+            self.remaining_tokens = self.remaining_tokens - tokens if self.tokens_reset_at > now else None
+
+    def update(self, headers, now: float) -> None:
+        remaining_requests = _header_int(headers, 'x-ratelimit-remaining-requests')
+        remaining_tokens = _header_int(headers, 'x-ratelimit-remaining-tokens')
+        requests_reset = parse_duration(headers.get('x-ratelimit-reset-requests'))
+        tokens_reset = parse_duration(headers.get('x-ratelimit-reset-tokens'))
+        retry_after = parse_duration(headers.get('retry-after'))
+
+        if remaining_requests is not None:
+            self.remaining_requests = remaining_requests
+            self.requests_reset_at = now + (requests_reset or 0.0)
+        if remaining_tokens is not None:
+            self.remaining_tokens = remaining_tokens
+            self.tokens_reset_at = now + (tokens_reset or 0.0)
+        if retry_after is not None:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+class PriorityGate:
+    """
+    A semaphore that hands free slots to the waiter with the lowest priority
+    value, in arrival order within a priority.
+    """
+
+    def __init__(self, slots: int):
+        self._free = max(1, slots)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int) -> None:
+        if self._free > 0 and not self.waiting:
+            self._free -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # We were handed a slot just as we got cancelled: pass it on
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class LLMScheduler:
+    """
+    Routes chat completions through priority admission, per-key token buckets
+    and model fallback tiers.
+    """
+
+    def __init__(self, models: List[str] = GROQ_MODELS, max_in_flight: int = LLM_MAX_IN_FLIGHT,
+                 max_attempts: int = LLM_MAX_ATTEMPTS, max_wait: float = LLM_MAX_WAIT):
+        self.models = list(models)
+        self.max_attempts = max(1, max_attempts)
+        self.max_wait = max_wait
+        self._gate = PriorityGate(max_in_flight)
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = defaultdict(TokenBucket)
+        self._requests = defaultdict(int)
+        self._rate_limited = defaultdict(int)
+        self._fallbacks = defaultdict(int)
+        self._failures = defaultdict(int)
+        self._queue_wait = defaultdict(lambda: {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+
+    async def _admit(self, priority: str) -> None:
+        queued_at = time.monotonic()
+        await self._gate.acquire(PRIORITIES.get(priority, DEFAULT_PRIORITY))
+        waited = time.monotonic() - queued_at
+        stats = self._queue_wait[priority]
+        stats["count"] += 1
+        stats["total_seconds"] += waited
+        stats["max_seconds"] = max(stats["max_seconds"], waited)
+
+    async def _request(self, client: AsyncGroq, messages: List[Dict[str, str]], priority: str,
+                       models: Optional[List[str]], max_completion_tokens: int, **kwargs):
+        # Holds a slot only while a request is out; a successful result is returned with its slot still held
+        tokens = estimate_tokens("".join(message["content"] for message in messages)) + max_completion_tokens
+        last_error: Optional[Exception] = None
+
+        for tier, model in enumerate(models or self.models):
+            bucket = self._buckets[(client.api_key, model)]
+            for attempt in range(self.max_attempts):
+                wait = bucket.wait_time(tokens, time.monotonic())
+                if wait > self.max_wait:
+                    break
+                # Full jitter keeps callers that were limited together from retrying together
+                backoff = random.uniform(0, LLM_BACKOFF_BASE * (2 ** attempt)) if attempt else 0.0
+                if wait or backoff:
+                    # Sleep without a slot, so calls held back by a rate limit don't block higher priorities
+                    await asyncio.sleep(wait + backoff)
+
+                with span("llm_queue"):
+                    await self._admit(priority)
+                bucket.reserve(tokens, time.monotonic())
+                self._requests[(priority, model)] += 1
+                started = time.perf_counter()
+                try:
+                    with span("llm"):
+                        raw = await client.chat.completions.with_raw_response.create(
+                            model=model, messages=messages, max_completion_tokens=max_completion_tokens, **kwargs
+                        )
+                except groq.RateLimitError as e:
+                    self._gate.release()
+                    bucket.update(e.response.headers, time.monotonic())
+                    self._rate_limited[(priority, model)] += 1
+                    LLM_REQUESTS.labels(priority, model, 'rate_limited').inc()
+                    last_error = e
+                    continue
+                except (groq.NotFoundError, groq.BadRequestError) as e:
+                    self._gate.release()
+                    if _is_json_validation_error(e):
+                        # The model answered; let the caller repair the rejected reply
+                        LLM_REQUESTS.labels(priority, model, 'invalid_json').inc()
+                        raise
+                    # Decommissioned or unsupported model: try the next tier
+                    self._failures[(priority, model)] += 1
+                    LLM_REQUESTS.labels(priority, model, 'failed').inc()
+                    last_error = e
+                    break
+                except BaseException:
+                    self._gate.release()
+                    raise
+                finally:
+                    LLM_REQUEST_SECONDS.labels(priority, model).observe(time.perf_counter() - started)
+
+                bucket.update(raw.headers, time.monotonic())
+                LLM_REQUESTS.labels(priority, model, 'ok').inc()
+                if tier > 0:
+                    self._fallbacks[(priority, model)] += 1
+                    LLM_FALLBACKS.labels(priority, model).inc()
+                try:
+                    result = raw.parse()
+                    result = await result if inspect.isawaitable(result) else result
+                except BaseException:
+                    self._gate.release()
+                    raise
+                # Streams report no usage up front
+                usage = getattr(result, 'usage', None)
+                if usage is not None:
+                    LLM_TOKENS.labels(priority, model, 'in').inc(usage.prompt_tokens or 0)
+                    LLM_TOKENS.labels(priority, model, 'out').inc(usage.completion_tokens or 0)
+                # The caller releases the slot once it's done with the result
+                return result
+
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("No model has capacity within the rate limits")
+
+    async def complete(self, client: AsyncGroq, messages: List[Dict[str, str]], priority: str = "default",
+                       models: Optional[List[str]] = None, max_completion_tokens: int = 1024, **kwargs):
+        """
+        Create a chat completion.
+
+        Args:
+            client: Groq client whose API key the call is billed to
+            messages: Chat messages
+            priority: Analysis the call belongs to, which sets its place in the queue
+            models: Models to try in order. Defaults to GROQ_MODELS
+            max_completion_tokens: Completion token limit
+            **kwargs: Passed through to chat.completions.create
+
+        Returns:
+            The ChatCompletion from the first model that accepted the call
+        """
+        result = await self._request(client, messages, priority, models, max_completion_tokens, **kwargs)
+        self._gate.release()
+        return result
+
+    async def stream(self, client: AsyncGroq, messages: List[Dict[str, str]], priority: str = "default",
+                     models: Optional[List[str]] = None, max_completion_tokens: int = 1024,
+                     **kwargs) -> AsyncIterator[str]:
+        """Like complete(), but yield the completion's text as it arrives."""
+        stream = await self._request(client, messages, priority, models, max_completion_tokens,
+                                     stream=True, **kwargs)
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            self._gate.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of request, rate-limit, fallback and queue-wait counters."""
+        def by_key(counter):
+            return [{"analysis": analysis, "model": model, "count": count}
+                    for (analysis, model), count in sorted(counter.items())]
+        return {
+            "in_queue": self._gate.waiting,
+            "requests": by_key(self._requests),
+            "rate_limited": by_key(self._rate_limited),
+            "fallbacks": by_key(self._fallbacks),
+            "failures": by_key(self._failures),
+            "queue_wait": {analysis: dict(stats) for analysis, stats in self._queue_wait.items()},
+        }
+
+
+# One connection pool shared by every Groq client in this worker
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(max_connections=GROQ_MAX_CONNECTIONS, max_keepalive_connections=GROQ_MAX_CONNECTIONS),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+_clients: Dict[str, AsyncGroq] = {}
+
+
+def get_client(api_key: str) -> AsyncGroq:
+    """Return the shared AsyncGroq client for an API key."""
+    client = _clients.get(api_key)
+    if client is None:
+        client = AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+        _clients[api_key] = client
+    return client
+
+
+scheduler = LLMScheduler()
@@ -0,0 +1,101 @@
+"""
+Per-stage timing and Prometheus metrics.
+
+Stages of a request are timed with `span`, which records a Prometheus
+histogram and adds the span to the current request's timings. The server
+sends those timings back in a Server-Timing header, where each stage's
+duration runs from its first span's start to its last span's end, so
+parallel calls to one stage aren't double counted.
+
+Counters cover cache hits, OCR'd pages, tokens saved by normalization
+and, per analysis and model, LLM requests, tokens, rate limits and
+fallbacks. /metrics serves everything in the Prometheus text format. With
+several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to a shared empty
+directory so every worker's samples are aggregated.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Stages run from milliseconds (cache lookups) to minutes (OCR of long scans)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram('restudy_stage_seconds', 'Time spent in each request stage', ['stage'],
+                          buckets=STAGE_BUCKETS)
+STAGE_ERRORS = Counter('restudy_stage_errors_total', 'Stages that raised an exception', ['stage'])
+CACHE_LOOKUPS = Counter('restudy_cache_lookups_total', 'Cache lookups by cache and result', ['cache', 'result'])
+OCR_PAGES = Counter('restudy_ocr_pages_total', 'Scanned pages by how their text was obtained', ['source'])
+NORMALIZATION_TOKENS = Counter('restudy_normalization_tokens_total',
+                               'Estimated document tokens before and after normalization', ['stage'])
+LLM_REQUEST_SECONDS = Histogram('restudy_llm_request_seconds', 'Duration of LLM requests',
+                                ['analysis', 'model'], buckets=STAGE_BUCKETS)
+LLM_REQUESTS = Counter('restudy_llm_requests_total', 'LLM requests by outcome',
+                       ['analysis', 'model', 'outcome'])
+LLM_TOKENS = Counter('restudy_llm_tokens_total', 'LLM tokens by direction',
+                     ['analysis', 'model', 'direction'])
+LLM_FALLBACKS = Counter('restudy_llm_fallbacks_total', 'LLM calls served by a fallback model',
+                        ['analysis', 'model'])
+
+# (stage, start, end) of every span in the current request
+_request_spans: ContextVar[Optional[List[Tuple[str, float, float]]]] = ContextVar('request_spans', default=None)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as one span of `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        ended = time.perf_counter()
+        STAGE_SECONDS.labels(stage).observe(ended - started)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, started, ended))
+
+
+def start_request() -> List[Tuple[str, float, float]]:
+    """Start collecting spans for the current request."""
+    spans: List[Tuple[str, float, float]] = []
+    _request_spans.set(spans)
+    return spans
+
+
+def server_timing(spans: List[Tuple[str, float, float]], total: Optional[float] = None) -> str:
+    """Format spans as a Server-Timing header value, in milliseconds."""
+    stages: Dict[str, List[float]] = {}
+    for stage, started, ended in spans:
+        bounds = stages.setdefault(stage, [started, ended])
+        bounds[0] = min(bounds[0], started)
+        bounds[1] = max(bounds[1], ended)
+    metrics = [f"{stage};dur={(ended - started) * 1000:.1f}" for stage, (started, ended) in stages.items()]
+    if total is not None:
+        metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Returns:
+        The metrics in the Prometheus text format, and its content type
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
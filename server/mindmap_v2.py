@@ -22,10 +22,18 @@ import graphviz
 import colorsys
 import hashlib
 import json
+import math
 import base64
 import os
 import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Any, Optional
+from metrics import span
+
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', '2'))
+
+_render_pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix='mindmap-render')
 
 
 class MindMapGenerator:
@@ -123,15 +131,16 @@ class MindMapGenerator:
                 sub_hue = colorsys.rgb_to_hsv(*[int(color[i:i+2], 16)/255 for i in (1, 3, 5)])[0]
                 self.create_nodes(g, node_id, item['subcategories'], color, metadata, level+1)
 
-    def generate_mind_map(self, data: Dict, output_filename: str = "mind_map", 
-                          dpi: int = 300, theme: str = "dark", 
+    def generate_mind_map(self, data: Dict, dpi: int = 300, theme: str = "dark", 
                           layout: str = "radial") -> Dict[str, str]:
         """
         Generate a mind map using Graphviz optimized for React integration.
         
+        The SVG is produced through Graphviz's stdout pipe, so nothing is written
+        to disk and concurrent renders can't collide.
+        
         Args:
             data: The hierarchical data structure for the mind map
-            output_filename: Base filename for the output
             dpi: Resolution of the generated image
             theme: Visual theme ('dark', 'light', 'green')
             layout: Layout algorithm ('radial', 'horizontal', 'vertical', 'force')
@@ -243,15 +252,8 @@ class MindMapGenerator:
         if layout == "radial":
             g.graph_attr['root'] = center_id
         
-        # Generate svg version
-        svg_path = g.render(output_filename, format='svg', cleanup=True)
-    
-        # Read SVG file
-        with open(svg_path, 'r', encoding='utf-8') as f:
-            svg_content = f.read()
-        
-        # Clean up temporary file
-        os.remove(svg_path)
+        # Generate svg version in memory
+        svg_content = g.pipe(format='svg', encoding='utf-8')
         
         # Return the SVG content and metadata
         return {
@@ -261,17 +263,184 @@ class MindMapGenerator:
             "layout": layout
         }
 
-def create_mind_map(data: Dict[str, Any], output_filename: str, dpi: int, theme: str, layout: str) -> Dict[str, Any]:
+    def build_graph_model(self, data: Dict) -> Dict[str, Any]:
+        """
+        Build a renderer-independent graph of the mind map with node positions
+        precomputed for every layout.
+        
+        The frontend can draw this model directly and switch theme or layout
+        without another request. Positions are normalized to [0, 1] on both axes.
+        
+        Args:
+            data: The hierarchical data structure for the mind map
+            
+        Returns:
+            Dictionary with nodes, edges, per-layout positions and theme colors
+        """
+        nodes = [{
+            "id": "center",
+            "text": data['title']['text'],
+            "description": data['title']['description'],
+            "level": 0,
+            "color": None
+        }]
+        edges = []
+        children: Dict[str, List[str]] = {"center": []}
+        seen_ids = {"center"}
+
+        def add_nodes(parent_id: str, items: List[Dict], color: str, level: int) -> None:
+            for item in items:
+                node_id = self.generate_id(item['text'])
+                # Repeated titles would share an ID; keep every occurrence as its own node
+                suffix = 1
+                while node_id in seen_ids:
+                    node_id = f"{self.generate_id(item['text'])}_{suffix}"
+                    suffix += 1
+                seen_ids.add(node_id)
+
+                nodes.append({
+                    "id": node_id,
+                    "text": item['text'],
+                    "description": item['description'],
+                    "level": level,
+                    "color": color
+                })
+                edges.append({"source": parent_id, "target": node_id})
+                children[parent_id].append(node_id)
+                children[node_id] = []
+                if item.get('subcategories'):
+                    add_nodes(node_id, item['subcategories'], color, level + 1)
+
+        colors = self.generate_colors(len(data['categories']))
+        for category, color in zip(data['categories'], colors):
+            add_nodes("center", [category], color, 1)
+
+        return {
+            "nodes": nodes,
+            "edges": edges,
+            "layouts": {
+                "radial": _radial_layout(children),
+                "horizontal": _tree_layout(children, horizontal=True),
+                "vertical": _tree_layout(children, horizontal=False),
+                "force": _force_layout(children, edges),
+            },
+            "themes": self.themes
+        }
+
+def _normalize_positions(positions: Dict[str, List[float]]) -> Dict[str, List[float]]:
+    xs = [x for x, _ in positions.values()]
+    ys = [y for _, y in positions.values()]
+    width = (max(xs) - min(xs)) or 1.0
+    height = (max(ys) - min(ys)) or 1.0
+    return {
+        node_id: [round((x - min(xs)) / width, 4), round((y - min(ys)) / height, 4)]
+        for node_id, (x, y) in positions.items()
+    }
+
+def _leaf_slots(children: Dict[str, List[str]]) -> Tuple[Dict[str, float], Dict[str, int]]:
+    """Place leaves on consecutive slots and center each parent over its children."""
+    slots, depths = {}, {}
+    next_slot = [0]
+
+    def visit(node_id: str, depth: int) -> None:
+        depths[node_id] = depth
+        if not children[node_id]:
+            slots[node_id] = next_slot[0]
+            next_slot[0] += 1
+            return
+        for child in children[node_id]:
+            visit(child, depth + 1)
+        slots[node_id] = sum(slots[child] for child in children[node_id]) / len(children[node_id])
+
+    visit("center", 0)
+    return slots, depths
+
+def _tree_layout(children: Dict[str, List[str]], horizontal: bool) -> Dict[str, List[float]]:
+    slots, depths = _leaf_slots(children)
+    if horizontal:
+        positions = {node_id: [depths[node_id] * 2.0, slots[node_id]] for node_id in slots}
+    else:
+        positions = {node_id: [slots[node_id] * 2.0, depths[node_id]] for node_id in slots}
+    return _normalize_positions(positions)
+
+def _radial_positions(children: Dict[str, List[str]]) -> Dict[str, List[float]]:
+    slots, depths = _leaf_slots(children)
+    leaves = max(1, sum(1 for node_id in children if not children[node_id]))
+    positions = {}
+    for node_id, slot in slots.items():
+        angle = 2 * math.pi * slot / leaves
+        positions[node_id] = [depths[node_id] * math.cos(angle), depths[node_id] * math.sin(angle)]
+    return positions
+
+def _radial_layout(children: Dict[str, List[str]]) -> Dict[str, List[float]]:
+    return _normalize_positions(_radial_positions(children))
+
+def _force_layout(children: Dict[str, List[str]], edges: List[Dict[str, str]],
+                  iterations: int = 60) -> Dict[str, List[float]]:
+    """Fruchterman-Reingold relaxation seeded from the radial layout, so results are deterministic."""
+    positions = _radial_positions(children)
+    node_ids = list(positions)
+    k = 1.0
+    temperature = 0.5
+    for _ in range(iterations):
+        displacement = {node_id: [0.0, 0.0] for node_id in node_ids}
+        for i, a in enumerate(node_ids):
+            for b in node_ids[i + 1:]:
+                dx = positions[a][0] - positions[b][0]
+                dy = positions[a][1] - positions[b][1]
+                distance = max(math.hypot(dx, dy), 0.01)
+                force = k * k / distance
+                displacement[a][0] += dx / distance * force
+                displacement[a][1] += dy / distance * force
+                displacement[b][0] -= dx / distance * force
+                displacement[b][1] -= dy / distance * force
+        for edge in edges:
+            a, b = edge["source"], edge["target"]
+            dx = positions[a][0] - positions[b][0]
+            dy = positions[a][1] - positions[b][1]
+            distance = max(math.hypot(dx, dy), 0.01)
+            force = distance * distance / k
+            displacement[a][0] -= dx / distance * force
+            displacement[a][1] -= dy / distance * force
+            displacement[b][0] += dx / distance * force
+            displacement[b][1] += dy / distance * force
+        for node_id in node_ids:
+            dx, dy = displacement[node_id]
+            length = max(math.hypot(dx, dy), 0.01)
+            step = min(length, temperature)
+            positions[node_id][0] += dx / length * step
+            positions[node_id][1] += dy / length * step
+        temperature *= 0.95
+    return _normalize_positions(positions)
+
+def create_mind_map(data: Dict[str, Any], dpi: int, theme: str, layout: str) -> Dict[str, Any]:
     
     
     # Generate mind map
     generator = MindMapGenerator()
     result = generator.generate_mind_map(
-        data, output_filename=output_filename, dpi=dpi, theme=theme, layout=layout
+        data, dpi=dpi, theme=theme, layout=layout
     )
 
     return result
 
+def create_graph_model(data: Dict[str, Any]) -> Dict[str, Any]:
+    return MindMapGenerator().build_graph_model(data)
+
+async def render_mind_map(data: Dict[str, Any], dpi: int, theme: str, layout: str) -> Dict[str, Any]:
+    """
+    Render a mind map on the bounded render pool, so at most RENDER_WORKERS
+    dot/neato subprocesses run at once in this worker.
+    """
+    loop = asyncio.get_running_loop()
+    with span("render"):
+        return await loop.run_in_executor(_render_pool, create_mind_map, data, dpi, theme, layout)
+
+async def warm_up() -> None:
+    """Render a one-node map so Graphviz's binaries and font cache are loaded."""
+    data = {'title': {'text': 'Warm-up', 'description': ''}, 'categories': []}
+    await render_mind_map(data, 300, "dark", "radial")
+
 if __name__ == "__main__":
     data = {
         'title': {
@@ -326,4 +495,4 @@ if __name__ == "__main__":
         
         ]
     }
-    create_mind_map(data, "mind_map", 300, "dark", "horizontal")
\ No newline at end of file
+    print(create_mind_map(data, 300, "dark", "horizontal")["svg"])
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Text normalization between extraction and analysis.
+
+Extracted text carries a lot that costs tokens without adding meaning:
+running headers and footers, page numbers, words hyphenated across line
+breaks and runs of whitespace. normalize_text removes them in one linear
+pass over the lines, keeping page boundaries (form feeds, which chunking
+splits on) intact.
+
+Headers and footers are found by comparing the first and last few lines of
+every page. A line counts as boilerplate when, with digits masked, it shows
+up at the same offset from the top or bottom of at least
+BOILERPLATE_MIN_FRACTION of the pages, which also catches page numbers like
+"Page 12 of 300". Short pages such as slides look at fewer lines per edge,
+so every page keeps at least BODY_LINES lines between its edges, and lines
+longer than BOILERPLATE_MAX_LINE_CHARS are taken to be content even when
+they repeat, as template sentences on worksheets do.
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from chunking import estimate_tokens
+
+BOILERPLATE_MIN_FRACTION = float(os.getenv('BOILERPLATE_MIN_FRACTION', '0.5'))
+# Fewer pages than this can't tell boilerplate from content
+BOILERPLATE_MIN_PAGES = 3
+# Headers and footers are short; longer repeated lines are content
+BOILERPLATE_MAX_LINE_CHARS = int(os.getenv('BOILERPLATE_MAX_LINE_CHARS', '60'))
+# Lines at each end of a page that may be headers or footers
+EDGE_LINES = 3
+# Lines every page keeps between its edges
+BODY_LINES = 2
+
+PAGE_BREAK = '\f'
+DIGITS = re.compile(r'\d+')
+HORIZONTAL_SPACE = re.compile(r'[ \t\u00a0\u2000-\u200a\u202f\u205f\u3000]+')
+INVISIBLE = re.compile(r'[\u00ad\u200b-\u200d\u2060\ufeff]')
+# A word broken over a line with a hyphen, continuing in lowercase
+HYPHENATED_BREAK = re.compile(r'(?<=[^\W\d_])-[ \t]*\n[ \t]*(?=[a-z\u00df-\u00f6\u00f8-\u00ff])')
+EXTRA_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def _line_key(line: str) -> str:
+    return DIGITS.sub('#', ' '.join(line.lower().split()))
+
+
+def _edges(lines: List[str]) -> List[Tuple[Tuple[str, int, str], int]]:
+    """
+    ((edge, offset, line key), line index) of the first and last EDGE_LINES
+    non-empty lines of a page, with offsets counted from their own edge.
+    Short pages have fewer edge lines, leaving BODY_LINES between them.
+    """
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    depth = min(EDGE_LINES, (len(content) - BODY_LINES) // 2)
+    if depth <= 0:
+        return []
+    top = [(('top', offset, _line_key(lines[i])), i) for offset, i in enumerate(content[:depth])]
+    bottom = [(('bottom', offset, _line_key(lines[i])), i)
+              for offset, i in enumerate(reversed(content[-depth:]))]
+    return [(key, i) for key, i in top + bottom if len(key[2]) <= BOILERPLATE_MAX_LINE_CHARS]
+
+
+def _clean_page(page: str) -> str:
+    page = INVISIBLE.sub('', page)
+    page = HORIZONTAL_SPACE.sub(' ', page)
+    page = HYPHENATED_BREAK.sub('', page)
+    page = '\n'.join(line.strip() for line in page.split('\n'))
+    return EXTRA_BLANK_LINES.sub('\n\n', page).strip()
+
+
+def normalize_text(text: str) -> Tuple[str, Dict[str, int]]:
+    """
+    Normalize extracted text.
+
+    Args:
+        text: Document text, with pages separated by form feeds
+
+    Returns:
+        The normalized text, and a report with the estimated tokens before and
+        after and the number of boilerplate lines removed
+    """
+    pages = [page.split('\n') for page in text.split(PAGE_BREAK)]
+
+    # Count each header and footer candidate once per page it appears on
+    page_edges = [_edges(lines) for lines in pages]
+    repeated = set()
+    if len(pages) >= BOILERPLATE_MIN_PAGES:
+        counts = Counter(key for edges in page_edges for key in {key for key, _ in edges} if key[2])
+        threshold = max(BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_FRACTION * len(pages))
+        repeated = {key for key, count in counts.items() if count >= threshold}
+
+    drops = [{i for key, i in edges if key in repeated} for edges in page_edges]
+    removed = 0
+    cleaned = []
+    for lines, drop in zip(pages, drops):
+        removed += len(drop)
+        cleaned.append(_clean_page('\n'.join(line for i, line in enumerate(lines) if i not in drop)))
+
+    normalized = PAGE_BREAK.join(cleaned)
+    return normalized, {
+        "tokens_before": estimate_tokens(text),
+        "tokens_after": estimate_tokens(normalized),
+        "boilerplate_lines": removed,
+    }
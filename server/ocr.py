@@ -0,0 +1,163 @@
+"""
+Shared OCR engine pool.
+
+Building an easyocr.Reader loads its detection and recognition models, which
+costs seconds of CPU and hundreds of MB of memory. Readers are created lazily,
+at most OCR_POOL_SIZE per language set, and reused by every request handled by
+this process. Callers that find every reader busy wait on the pool's queue, so
+the number of concurrent recognitions never exceeds the pool size.
+"""
+
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+OCR_LANGUAGES = [lang.strip() for lang in os.getenv('OCR_LANGUAGES', 'en,es').split(',') if lang.strip()]
+OCR_POOL_SIZE = int(os.getenv('OCR_POOL_SIZE', '1'))
+OCR_BATCH_SIZE = int(os.getenv('OCR_BATCH_SIZE', '8'))
+OCR_QUEUE_TIMEOUT = float(os.getenv('OCR_QUEUE_TIMEOUT', '300'))
+OCR_USE_GPU = os.getenv('OCR_USE_GPU', 'false').lower() == 'true'
+# Pages padded to a shared size for a batch may add at most this much area;
+# batches of very different shapes are recognized one page at a time instead
+OCR_MAX_PADDING = 1.0
+
+
+def _pad_batch(images: Sequence) -> Optional[List]:
+    """
+    Pad page images to the batch's largest height and width with each page's
+    background level, so they can be recognized in one readtext_batched call.
+    Pages are cropped to their content, so they rarely share a size as is.
+
+    Returns:
+        The padded images, or None if that would add too much blank area
+    """
+    import numpy as np
+    if len({image.ndim for image in images}) != 1:
+        return None
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    area = sum(image.shape[0] * image.shape[1] for image in images)
+    if height * width * len(images) > area * (1 + OCR_MAX_PADDING):
+        return None
+    padded = []
+    for image in images:
+        padding = [(0, height - image.shape[0]), (0, width - image.shape[1])] + [(0, 0)] * (image.ndim - 2)
+        padded.append(np.pad(image, padding, constant_values=np.median(image)))
+    return padded
+
+
+class OCREnginePool:
+    """
+    A bounded pool of easyocr readers sharing one language set.
+    """
+
+    def __init__(self, languages: Sequence[str], size: int = 1, gpu: bool = False):
+        self.languages = list(languages)
+        self.size = max(1, size)
+        self.gpu = gpu
+        self._engines = queue.Queue(maxsize=self.size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self, timeout: float):
+        try:
+            return self._engines.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if not can_create:
+            try:
+                return self._engines.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError("Timed out waiting for a free OCR engine") from None
+
+        try:
+            import easyocr
+            return easyocr.Reader(self.languages, gpu=self.gpu)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _release(self, engine) -> None:
+        self._engines.put_nowait(engine)
+
+    def warm_up(self) -> None:
+        """Load one reader's models ahead of the first request."""
+        self._release(self._acquire(OCR_QUEUE_TIMEOUT))
+
+    def readtext(self, images: Sequence, batch_size: int = OCR_BATCH_SIZE) -> List[str]:
+        """
+        Recognize the text in a list of page images.
+
+        Args:
+            images: Page images as NumPy arrays
+            batch_size: Maximum number of pages sent to one recognition call
+
+        Returns:
+            The recognized text of each image, in input order
+        """
+        if not images:
+            return []
+
+        engine = self._acquire(OCR_QUEUE_TIMEOUT)
+        try:
+            texts = []
+            for start in range(0, len(images), max(1, batch_size)):
+                batch = list(images[start:start + batch_size])
+                # readtext_batched needs every image in the batch to share a size
+                padded = _pad_batch(batch) if len(batch) > 1 else None
+                if padded is not None:
+                    results = engine.readtext_batched(padded, detail=0)
+                else:
+                    results = [engine.readtext(image, detail=0) for image in batch]
+                texts.extend(" ".join(result) for result in results)
+            return texts
+        finally:
+            self._release(engine)
+
+
+def encode_image(image) -> bytes:
+    """
+    Encode a page image as PNG. Pages travel between processes in this form,
+    which is a fraction of the size of the raw pixel array.
+    """
+    import io
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def decode_image(data: bytes):
+    """Decode a page image produced by encode_image into a NumPy array."""
+    import io
+    import numpy as np
+    from PIL import Image
+    return np.asarray(Image.open(io.BytesIO(data)))
+
+
+_pools: Dict[Tuple[str, ...], OCREnginePool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_ocr_pool(languages: Optional[Sequence[str]] = None) -> OCREnginePool:
+    """Return the process-wide pool for a language set, creating it on first use."""
+    key = tuple(languages or OCR_LANGUAGES)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = OCREnginePool(key, size=OCR_POOL_SIZE, gpu=OCR_USE_GPU)
+            _pools[key] = pool
+        return pool
+
+
+def ocr_images(images: Sequence, languages: Optional[Sequence[str]] = None) -> List[str]:
+    """Recognize a batch of page images with the shared pool for `languages`."""
+    return get_ocr_pool(languages).readtext(images)
@@ -0,0 +1,199 @@
+"""
+OCR sidecar process.
+
+Every uvicorn worker that runs OCR itself loads its own copy of the easyocr
+models. With OCR_SIDECAR enabled, OCR is instead served by one dedicated
+process listening on a local Unix socket: the models are loaded once per
+host, the API workers send it page images as compact PNG buffers, and its
+throughput is set by OCR_POOL_SIZE independently of the number of API
+workers. Requests from several connections share the sidecar's engine pool,
+so at most OCR_POOL_SIZE page batches are recognized at a time.
+
+The sidecar is started by `python server.py`, or can be run on its own with
+`OCR_SIDECAR_KEY=<secret> python ocr_service.py`. Requests arrive pickled, so
+the sidecar only accepts connections authenticated with that key, on a socket
+only its user can open. Workers that can't reach it fall back to OCR in their
+own process.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import List, Optional, Sequence
+
+from ocr import OCR_LANGUAGES, decode_image, get_ocr_pool
+
+OCR_SIDECAR = os.getenv('OCR_SIDECAR', 'false').lower() == 'true'
+OCR_SIDECAR_SOCKET = os.getenv('OCR_SIDECAR_SOCKET', os.path.join(tempfile.gettempdir(), 'restudy-ocr.sock'))
+# Shared secret used to authenticate connections to the sidecar
+OCR_SIDECAR_KEY = os.getenv('OCR_SIDECAR_KEY')
+# How long a request waits for the sidecar before OCRing in its own worker
+OCR_SIDECAR_CONNECT_TIMEOUT = float(os.getenv('OCR_SIDECAR_CONNECT_TIMEOUT', '2'))
+# How long the startup warm-up waits while the sidecar is still starting
+OCR_SIDECAR_STARTUP_TIMEOUT = float(os.getenv('OCR_SIDECAR_STARTUP_TIMEOUT', '30'))
+# After failing to reach the sidecar, workers OCR locally for this long before trying it again
+OCR_SIDECAR_RETRY_SECONDS = float(os.getenv('OCR_SIDECAR_RETRY_SECONDS', '30'))
+
+
+class SidecarUnavailable(ConnectionError):
+    """The OCR sidecar isn't running or refused the connection."""
+
+
+def _authkey() -> Optional[bytes]:
+    return OCR_SIDECAR_KEY.encode('utf-8') if OCR_SIDECAR_KEY else None
+
+
+def _serve_connection(connection) -> None:
+    with connection:
+        while True:
+            try:
+                command, languages, images = connection.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                pool = get_ocr_pool(languages)
+                if command == 'warm_up':
+                    pool.warm_up()
+                    result = []
+                else:
+                    result = pool.readtext([decode_image(image) for image in images])
+                connection.send(('ok', result))
+            except Exception as e:
+                connection.send(('error', repr(e)))
+
+
+def serve(address: str = OCR_SIDECAR_SOCKET) -> None:
+    """
+    Serve OCR requests on a Unix socket until the process is stopped. Each
+    connection is handled on its own thread.
+
+    Raises:
+        RuntimeError: If OCR_SIDECAR_KEY isn't set
+    """
+    authkey = _authkey()
+    if authkey is None:
+        raise RuntimeError("Set OCR_SIDECAR_KEY: without it the sidecar would unpickle requests from anyone")
+    if os.path.exists(address):
+        os.unlink(address)
+    # Create the socket readable and writable by this user only
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, family='AF_UNIX', authkey=authkey)
+    finally:
+        os.umask(umask)
+    with listener:
+        print(f"OCR sidecar listening on {address}")
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                # A client that fails authentication shouldn't stop the sidecar
+                print(f"Rejected OCR sidecar connection: {e!r}")
+                continue
+            threading.Thread(target=_serve_connection, args=(connection,), daemon=True).start()
+
+
+def start_sidecar():
+    """
+    Start the sidecar in a child process. Workers started afterwards inherit
+    its socket path and key through the environment.
+
+    Returns:
+        The sidecar's multiprocessing.Process
+    """
+    import multiprocessing
+    import secrets
+
+    global OCR_SIDECAR_KEY
+    if not OCR_SIDECAR_KEY:
+        OCR_SIDECAR_KEY = secrets.token_hex(16)
+        os.environ['OCR_SIDECAR_KEY'] = OCR_SIDECAR_KEY
+    process = multiprocessing.get_context('spawn').Process(
+        target=serve, args=(OCR_SIDECAR_SOCKET,), name='ocr-sidecar', daemon=True
+    )
+    process.start()
+    return process
+
+
+class SidecarClient:
+    """
+    A worker's connections to the sidecar. Idle connections are kept for
+    reuse; a request that's in flight owns its connection. Once the sidecar
+    can't be reached, requests fail fast for OCR_SIDECAR_RETRY_SECONDS
+    instead of each waiting out the connect timeout.
+    """
+
+    def __init__(self, address: str = OCR_SIDECAR_SOCKET):
+        self.address = address
+        self._idle = []
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+
+    def _mark_down(self) -> None:
+        with self._lock:
+            self._down_until = time.monotonic() + OCR_SIDECAR_RETRY_SECONDS
+
+    def _connect(self, timeout: float = OCR_SIDECAR_CONNECT_TIMEOUT):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if time.monotonic() < self._down_until:
+                raise SidecarUnavailable(f"OCR sidecar at {self.address} was unreachable recently")
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return Client(self.address, family='AF_UNIX', authkey=_authkey())
+            except (FileNotFoundError, ConnectionRefusedError) as e:
+                if time.monotonic() >= deadline:
+                    self._mark_down()
+                    raise SidecarUnavailable(f"OCR sidecar not reachable at {self.address}") from e
+                time.sleep(0.2)
+            except (AuthenticationError, OSError, EOFError) as e:
+                # A key mismatch won't fix itself by retrying
+                self._mark_down()
+                raise SidecarUnavailable(f"OCR sidecar at {self.address} rejected the connection: {e!r}") from e
+
+    def _call(self, command: str, languages: Sequence[str], images: Sequence[bytes],
+              timeout: float = OCR_SIDECAR_CONNECT_TIMEOUT):
+        connection = self._connect(timeout)
+        try:
+            connection.send((command, list(languages), list(images)))
+            status, result = connection.recv()
+        except (EOFError, OSError, AuthenticationError) as e:
+            connection.close()
+            self._mark_down()
+            raise SidecarUnavailable("Lost the connection to the OCR sidecar") from e
+        with self._lock:
+            self._idle.append(connection)
+        if status != 'ok':
+            raise RuntimeError(f"OCR sidecar failed: {result}")
+        return result
+
+    def readtext(self, images: Sequence[bytes], languages: Optional[Sequence[str]] = None) -> List[str]:
+        """
+        Recognize encoded page images in the sidecar.
+
+        Args:
+            images: Page images encoded with ocr.encode_image
+            languages: OCR languages. Defaults to OCR_LANGUAGES
+
+        Returns:
+            The recognized text of each image, in input order
+        """
+        if not images:
+            return []
+        return self._call('ocr', languages or OCR_LANGUAGES, images)
+
+    def warm_up(self, languages: Optional[Sequence[str]] = None) -> None:
+        """Have the sidecar load its models ahead of the first request."""
+        self._call('warm_up', languages or OCR_LANGUAGES, [], timeout=OCR_SIDECAR_STARTUP_TIMEOUT)
+
+
+sidecar_client = SidecarClient()
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,13 +1,67 @@
+import asyncio
 import json
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote_plus
-from groq import Groq
 from dotenv import load_dotenv
 import os
-from googleapiclient.discovery import build
+from cache import make_cache, make_key
+from chunking import sample_text
+from llm import scheduler, get_client
+from metrics import span
 
+SEARCH_PHRASE_TOKENS = 2000
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', str(24 * 3600)))
+# 'llm' asks Groq for the search phrase; 'local' uses TextRank keyphrases and skips the round-trip
+SEARCH_PHRASE_MODE = os.getenv('SEARCH_PHRASE_MODE', 'llm')
+RESOURCES_QUERIES = int(os.getenv('RESOURCES_QUERIES', '1'))
+RESOURCES_PHRASE_TIMEOUT = float(os.getenv('RESOURCES_PHRASE_TIMEOUT', '15'))
+RESOURCES_SEARCH_TIMEOUT = float(os.getenv('RESOURCES_SEARCH_TIMEOUT', '10'))
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '8'))
+# Alternative Custom Search endpoint, e.g. the benchmark's local stand-in
+GOOGLE_SEARCH_ENDPOINT = os.getenv('GOOGLE_SEARCH_ENDPOINT')
 
-async def text_to_search_links(text, groq_api_key, google_api_key, google_cse_id, max_results=5):
+# The Google client blocks, so searches run here. A timed-out search keeps its
+# thread until Google answers, and this pool bounds how many can pile up.
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='google-search')
+
+# Links for recently searched phrases, so popular topics skip the Google quota
+search_cache = make_cache('searches', ttl=SEARCH_CACHE_TTL)
+
+# httplib2, which the Google client uses, isn't thread-safe: keep one service per thread
+_google_services = threading.local()
+
+
+def get_search_service(api_key):
+    """Return this thread's Custom Search service for an API key, building it once."""
+    services = getattr(_google_services, 'by_key', None)
+    if services is None:
+        services = _google_services.by_key = {}
+    service = services.get(api_key)
+    if service is None:
+        from googleapiclient.discovery import build
+        # The bundled discovery document avoids fetching it over the network
+        client_options = {"api_endpoint": GOOGLE_SEARCH_ENDPOINT} if GOOGLE_SEARCH_ENDPOINT else None
+        service = build("customsearch", "v1", developerKey=api_key, static_discovery=True, cache_discovery=False,
+                        client_options=client_options)
+        services[api_key] = service
+    return service
+
+
+async def warm_up():
+    """Load the Google client library and, in local mode, the keyphrase extractor."""
+    await asyncio.to_thread(__import__, 'googleapiclient.discovery')
+    if SEARCH_PHRASE_MODE == 'local':
+        await asyncio.to_thread(__import__, 'keyphrases')
+
+
+def normalize_search_phrase(phrase):
+    """Lowercase a phrase and collapse punctuation and whitespace, so trivial variants share a cache entry."""
+    return " ".join(re.sub(r'[^\w\s]', ' ', phrase.lower()).split())
+
+
+async def text_to_search_links(text, groq_api_key, google_api_key, google_cse_id, max_results=5, queries=RESOURCES_QUERIES):
     """
     Convert a long text to a Google search phrase using Groq API,
     then search for relevant resources and return a list of links.
@@ -16,33 +70,77 @@ async def text_to_search_links(text, groq_api_key, google_api_key, google_cse_id
         text (str): The input text to analyze
         groq_api_key (str): Your Groq API key
         max_results (int, optional): Maximum number of links to return. Defaults to 5.
+        queries (int, optional): Number of search phrases to search concurrently. Defaults to RESOURCES_QUERIES.
         
     Returns:
         list: A list of relevant URLs
     """
-    # Step 1: Generate search phrase with Groq API
-    search_phrase = generate_search_phrase_with_groq(text, groq_api_key)
+    # Step 1: Generate search phrases, with Groq API or locally
+    with span("search_phrases"):
+        if SEARCH_PHRASE_MODE == 'local':
+            # TextRank is CPU-bound: keep it off the event loop
+            search_phrases = await asyncio.to_thread(local_search_phrases, text, queries)
+        else:
+            search_phrases = await generate_search_phrases_with_groq(text, groq_api_key, queries)
     
-    # Step 2: Perform Google search with the generated phrase
-    search_results = google_search(search_phrase, google_api_key, google_cse_id, max_results)
+    # Step 2: Search every phrase concurrently and merge the links
+    return await search_links(search_phrases, google_api_key, google_cse_id, max_results)
+
+async def search_links(search_phrases, google_api_key, google_cse_id, max_results=5):
+    """Search every phrase concurrently and merge their links, best results first."""
+    with span("search"):
+        results = await asyncio.gather(*(
+            search_with_timeout(phrase, google_api_key, google_cse_id, max_results) for phrase in search_phrases
+        ))
     
-    return search_results
+    return merge_links(results, max_results)
+
+def merge_links(results, max_results):
+    """Interleave the links of several searches, best results first, without duplicates."""
+    links = []
+    seen = set()
+    for rank in range(max((len(result) for result in results), default=0)):
+        for result in results:
+            if rank < len(result) and result[rank] not in seen:
+                seen.add(result[rank])
+                links.append(result[rank])
+    return links[:max_results]
 
-def generate_search_phrase_with_groq(text, api_key):
+async def search_with_timeout(query, api_key, cse_id, max_results=5):
+    """Run google_search on the search pool, giving up after RESOURCES_SEARCH_TIMEOUT seconds."""
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(
+            loop.run_in_executor(_search_pool, google_search, query, api_key, cse_id, max_results),
+            RESOURCES_SEARCH_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        print(f"Google search timed out for: {query}")
+        return []
+
+async def generate_search_phrases_with_groq(text, api_key, count=1):
     """
-    Use Groq API to generate a concise search phrase from text.
+    Use Groq API to generate one or more distinct search phrases from text.
+    Falls back to local keyphrase extraction if the call fails or takes longer
+    than RESOURCES_PHRASE_TIMEOUT seconds.
     
     Args:
         text (str): The input text to analyze
         api_key (str): Your Groq API key
+        count (int): Number of phrases to generate
         
     Returns:
-        str: A search phrase suitable for Google
+        list: Search phrases suitable for Google
     """
-    if len(text) > 8000:
-        text = text[:8000] + "..."
+    # Sample the whole document rather than cutting it off after the first pages
+    text = sample_text(text, SEARCH_PHRASE_TOKENS)
+    
+    client = get_client(api_key)
     
-    client = Groq(api_key=api_key)
+    if count > 1:
+        request = f"Please generate {count} different search queries, each covering a different aspect of the text, one per line, without numbering, explanation or additional text."
+    else:
+        request = "Please generate ONLY the search query, without any explanation or additional text."
     
     prompt = f"""
     I need to convert the following text into a concise and effective Google search query. 
@@ -53,42 +151,46 @@ def generate_search_phrase_with_groq(text, api_key):
     Text to analyze:
     {text}
     
-    Please generate ONLY the search query, without any explanation or additional text.
+    {request}
     """
     
     try:
-        chat_completion = client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that creates effective search queries."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
-            max_tokens=100
+        chat_completion = await asyncio.wait_for(
+            scheduler.complete(
+                client,
+                [
+                    {"role": "system", "content": "You are a helpful assistant that creates effective search queries."},
+                    {"role": "user", "content": prompt}
+                ],
+                priority="resources",
+                temperature=0.2,
+                max_completion_tokens=100 * count
+            ),
+            RESOURCES_PHRASE_TIMEOUT
         )
         
-        search_phrase = chat_completion.choices[0].message.content.strip()
-        
-        search_phrase = re.sub(r'^["\']|["\']$', '', search_phrase) 
-        search_phrase = search_phrase.split("\n")[0]
+        search_phrases = []
+        for line in chat_completion.choices[0].message.content.strip().split("\n"):
+            search_phrase = re.sub(r'^["\']|["\']$', '', line.strip())
+            if search_phrase:
+                search_phrases.append(search_phrase)
         
-        return search_phrase
+        return search_phrases[:count] or await asyncio.to_thread(local_search_phrases, text, count)
     
     except Exception as e:
-        print(f"Error calling Groq API: {e}")
-        # Fallback: extract keywords if API fails
-        words = re.findall(r'\b\w{4,}\b', text.lower())
-        word_freq = {}
-        for word in words:
-            if word in word_freq:
-                word_freq[word] += 1
-            else:
-                word_freq[word] = 1
-        
-        # Get the most frequent 5-7 words
-        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        top_words = [word for word, _ in sorted_words[:6]]
-        return " ".join(top_words)
+        print(f"Error calling Groq API: {e!r}")
+        return await asyncio.to_thread(local_search_phrases, text, count)
+
+def local_search_phrases(text, count=1):
+    """
+    Search phrases from TextRank keyphrases, computed locally without an API call.
+    Long texts are sampled first, as for the Groq prompt. CPU-bound: call it
+    off the event loop.
+    """
+    # NumPy is only needed here, so it's loaded on first use
+    from keyphrases import keyphrase_search_queries
+    text = sample_text(text, SEARCH_PHRASE_TOKENS)
+    return keyphrase_search_queries(text, count) or [" ".join(text.split()[:8])]
     
 def google_search(query, api_key, cse_id, max_results=5):
     """
@@ -103,8 +205,13 @@ def google_search(query, api_key, cse_id, max_results=5):
     Returns:
         list: A list of URLs
     """
+    cache_key = make_key("search", normalize_search_phrase(query), cse_id, max_results)
+    cached = search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        service = build("customsearch", "v1", developerKey=api_key)
+        service = get_search_service(api_key)
         
         result = service.cse().list(
             q=query,
@@ -117,6 +224,8 @@ def google_search(query, api_key, cse_id, max_results=5):
             for item in result['items']:
                 links.append(item['link'])
         
+        if links:
+            search_cache.set(cache_key, links)
         return links
     
     except Exception as e:
@@ -126,7 +235,7 @@ def google_search(query, api_key, cse_id, max_results=5):
 
 # Example usage:
 if __name__ == "__main__":
-    sample_text = """
+    example_text = """
     Each neuron is made up of a cell body (the central mass of the cell) with a number of connections coming off it: numerous dendrites (the cell's inputs—carrying information toward the cell body) and a single axon (the cell's output—carrying information away). Neurons are so tiny that you could pack about 100 of their cell bodies into a single millimeter. (It's also worth noting, briefly in passing, that neurons make up only 10–50 percent of all the cells in the brain; the rest are glial cells, also called neuroglia, that support and protect the neurons and feed them with energy that allows them to work and grow.) [1] Inside a computer, the equivalent to a brain cell is a nanoscopically tiny switching device called a transistor. The latest, cutting-edge microprocessors (single-chip computers) contain over 50 billion transistors; even a basic Pentium microprocessor from about 20 years ago had about 50 million transistors, all packed onto an integrated circuit just 25mm square (smaller than a postage stamp)
 That's where the comparison between computers and brains begins and ends, because the two things are completely different. It's not just that computers are cold metal boxes stuffed full of binary numbers, while brains are warm, living, things packed with thoughts, feelings, and memories. The real difference is that computers and brains "think" in completely different ways. The transistors in a computer are wired in relatively simple, serial chains (each one is connected to maybe two or three others in basic arrangements known as logic gates), whereas the neurons in a brain are densely interconnected in complex, parallel ways (each one is connected to perhaps 10,000 of its neighbors).
     """
@@ -135,7 +244,7 @@ That's where the comparison between computers and brains begins and ends, becaus
     groq_api_key = os.getenv('GROQ_RESTUDY_RESOURCES')
     google_api_key = os.getenv('GOOGLE_SEARCH_KEY')
     google_cse_id = os.getenv('GOOGLE_SEARCH_ID') 
-    results = text_to_search_links(sample_text, groq_api_key, google_api_key, google_cse_id)
+    results = asyncio.run(text_to_search_links(example_text, groq_api_key, google_api_key, google_cse_id))
     
     print("Search results:")
     for i, url in enumerate(results, 1):
@@ -1,32 +1,40 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from startup import ImportTimer, run_warmup, startup_report
+import_timer = ImportTimer()
+import_timer.start()
+
+from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, Annotated, Union
-from PyPDF2 import PdfReader
-from docx import Document
-import io
 import os
-import groq
-from groq import Groq, RateLimitError
-import json
-import ast
-import networkx as nx
-from itertools import combinations
-import base64
-import re
-from dotenv import load_dotenv
-from PIL import Image
-from pdf2image import convert_from_bytes
-import easyocr
-import numpy as np
-import fitz
-from resources import text_to_search_links
-from mindmap_v2 import create_mind_map
 import json
 import asyncio
+import math
+import time
+from dotenv import load_dotenv
 
-app = FastAPI()
+# The modules below read their settings at import time
 load_dotenv('.env')
+
+import extraction
+import mindmap_v2
+import resources
+from resources import text_to_search_links, search_links, RESOURCES_QUERIES
+from extraction import extract_pdf_text, extract_docx_text, shutdown_pools
+from uploads import IngestedUpload, ingest_upload, ingest_file, upload_too_large, MAX_UPLOAD_BYTES
+from mindmap_v2 import render_mind_map, create_graph_model
+from cache import make_cache, make_key, hash_text
+from llm import scheduler, get_client, http_client as llm_http_client, PRIORITIES
+from structured import complete_structured, QuestionSet, MindMap, FusedAnalysis
+from chunking import split_into_chunks, map_chunks, merge_questions, merge_mind_maps, pick_evenly
+from metrics import span, start_request, server_timing, render_metrics, NORMALIZATION_TOKENS
+from normalize import normalize_text
+from jobs import JobStore, JobProgress, FINISHED, JOB_POLL_SECONDS, public_view, start_job_workers
+
+import_timer.stop()
+
+app = FastAPI()
 PORT = os.getenv('PORT')
 
 GROQ_TOKEN_SUMMARY = os.getenv('GROQ_RESTUDY_SUMMARY')
@@ -36,9 +44,27 @@ GROQ_TOKEN_RESOURCES = os.getenv('GROQ_RESTUDY_RESOURCES')
 SEARCH_ENGINE_ID = os.getenv('GOOGLE_SEARCH_ID')
 SEARCH_API = os.getenv('GOOGLE_SEARCH_KEY')
 
-summary_client = Groq(api_key=GROQ_TOKEN_SUMMARY)
-questions_client = Groq(api_key=GROQ_TOKEN_QUESTIONS)
-mindmap_client = Groq(api_key=GROQ_TOKEN_MINDMAP)
+summary_client = get_client(GROQ_TOKEN_SUMMARY)
+questions_client = get_client(GROQ_TOKEN_QUESTIONS)
+mindmap_client = get_client(GROQ_TOKEN_MINDMAP)
+
+DISCONNECT_POLL_SECONDS = 1.0
+RENDER_CACHE_ENTRIES = int(os.getenv('RENDER_CACHE_ENTRIES', '512'))
+# Extracted documents run to megabytes each, so the in-memory cache is bounded by size per worker
+DOCUMENT_CACHE_BYTES = int(os.getenv('DOCUMENT_CACHE_BYTES', str(64 * 2 ** 20)))
+# Ask for every LLM analysis of a single-chunk document in one call
+FUSED_ANALYSES = os.getenv('FUSED_ANALYSES', 'false').lower() == 'true'
+FUSABLE_ANALYSES = ("summary", "questions", "mindmap", "resources")
+
+result_cache = make_cache('results')
+document_cache = make_cache('documents', max_bytes=DOCUMENT_CACHE_BYTES)
+# Parsed mind map structures by ID, and their rendered SVGs by (ID, theme, layout).
+# Clients fetch IDs from any worker, so structures always go to the shared SQLite store.
+mindmap_store = make_cache('mindmaps', shared=True)
+render_cache = make_cache('renders', max_entries=RENDER_CACHE_ENTRIES)
+job_store = JobStore()
+
+SUMMARY_ERROR = "There has been an error summarizing the document."
 
 class TextInput(BaseModel):
     text: str
@@ -57,12 +83,83 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Multipart framing adds a little on top of the file itself
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse bodies that announce a size over the cap before they are parsed
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + UPLOAD_OVERHEAD_BYTES:
+        error = upload_too_large(int(content_length))
+        return JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+    return await call_next(request)
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    # Stages of this request record their spans here; see metrics.span
+    spans = start_request()
+    started = time.perf_counter()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = server_timing(spans, time.perf_counter() - started)
+    return response
+
+WARMUP_HOOKS = {
+    "extraction": extraction.warm_up,
+    "ocr": extraction.warm_up_ocr,
+    "mindmap": mindmap_v2.warm_up,
+    "search": resources.warm_up,
+}
+startup_state = {"ready_at": None, "warmup": {}}
+
+async def warm_up_features():
+    startup_state["warmup"] = await run_warmup(WARMUP_HOOKS)
+
+@app.on_event("startup")
+async def report_startup():
+    startup_state["ready_at"] = time.perf_counter()
+    print("Startup:", json.dumps(startup_report(import_timer, startup_state["ready_at"], {})))
+    # Warm up in the background so the worker starts serving right away
+    startup_state["warmup_task"] = asyncio.create_task(warm_up_features())
+
+@app.get("/startup")
+async def startup_timings():
+    return startup_report(import_timer, startup_state["ready_at"], startup_state["warmup"])
+
+@app.on_event("startup")
+async def start_jobs():
+    startup_state["job_workers"] = start_job_workers(job_store, run_job)
+
+@app.on_event("shutdown")
+async def stop_extraction_workers():
+    # Running jobs go back to the queue for the next worker
+    for task in startup_state.get("job_workers", []):
+        task.cancel()
+    await asyncio.gather(*startup_state.get("job_workers", []), return_exceptions=True)
+    shutdown_pools()
+    await llm_http_client.aclose()
+
+@app.get("/mindmap/{mindmap_id}")
+async def render_mindmap(mindmap_id: str, theme: str = "dark", layout: str = "radial"):
+    rendered = await render_stored_mind_map(mindmap_id, layout, theme)
+    return Response(content=rendered, media_type="application/json")
+
+@app.get("/llm-stats")
+async def llm_stats():
+    return scheduler.stats()
+
+@app.get("/metrics")
+async def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 @app.get("/")
 async def read_root():
     return None
 
 @app.post("/analyze-content")
 async def analyze_content(
+    request: Request,
     text: Annotated[str | None, Form()] = None,
     document: UploadFile | None = None,
     summary_length: str = Form(...),
@@ -70,162 +167,295 @@ async def analyze_content(
     question_difficulty: str = Form(...),
     analysis_type: str = Form(...),
     layout: str = Form(...),
-    theme: str = Form(...)
+    theme: str = Form(...),
+    mindmap_format: str = Form("svg")
 ):
     if document:
-        content = get_doc_content(document)
+        content = await get_doc_content(document)
     elif text:
-        content = text
+        content = normalize_content(text)
     else:
         raise ValueError("Either text or document must be provided")
         
-    return await process_content(
+    return await cancel_on_disconnect(request, process_content(
         content,
         summary_length,
         question_number,
         question_difficulty,
         analysis_type,
         layout,
-        theme
+        theme,
+        mindmap_format
+    ))
+
+async def cancel_on_disconnect(request: Request, coroutine):
+    """Await a coroutine, cancelling it if the client disconnects first."""
+    task = asyncio.ensure_future(coroutine)
+    while not task.done():
+        await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+        if not task.done() and await request.is_disconnected():
+            task.cancel()
+            # Nobody is listening any more; 499 is the conventional "client closed request"
+            return Response(status_code=499)
+    return task.result()
+
+@app.post("/analyze-content/stream")
+async def analyze_content_stream(
+    text: Annotated[str | None, Form()] = None,
+    document: UploadFile | None = None,
+    summary_length: str = Form(...),
+    question_number: str = Form(...),
+    question_difficulty: str = Form(...),
+    analysis_type: str = Form(...),
+    layout: str = Form(...),
+    theme: str = Form(...),
+    mindmap_format: str = Form("svg")
+):
+    if document:
+        content = await get_doc_content(document)
+    elif text:
+        content = normalize_content(text)
+    else:
+        raise ValueError("Either text or document must be provided")
+
+    return StreamingResponse(
+        stream_content(content, summary_length, question_number, question_difficulty, analysis_type, layout, theme, mindmap_format),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-def get_doc_content(doc: UploadFile = File(...)):
-    chunk_size = 1024 * 1024  # 1MB chunks
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    text: Annotated[str | None, Form()] = None,
+    document: UploadFile | None = None,
+    summary_length: str = Form(...),
+    question_number: str = Form(...),
+    question_difficulty: str = Form(...),
+    analysis_type: str = Form(...),
+    layout: str = Form(...),
+    theme: str = Form(...),
+    mindmap_format: str = Form("svg")
+):
+    """Queue an analysis as a background job and return its ID right away."""
+    if not document and not text:
+        raise ValueError("Either text or document must be provided")
+
+    job_id = job_store.new_id()
+    params = {
+        "summary_length": summary_length,
+        "question_number": question_number,
+        "question_difficulty": question_difficulty,
+        "analysis_type": analysis_type,
+        "layout": layout,
+        "theme": theme,
+        "mindmap_format": mindmap_format,
+        "text": None if document else text,
+    }
+    document_path = None
+    if document:
+        with span("upload"):
+            upload = await ingest_upload(document)
+        try:
+            params["filename"] = upload.filename
+            document_path = job_store.document_path(job_id, os.path.splitext(upload.filename)[1])
+            await asyncio.to_thread(upload.save, document_path)
+        finally:
+            upload.close()
+
+    await asyncio.to_thread(job_store.create, job_id, params, document_path)
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_view(job)
+
+@app.websocket("/jobs/{job_id}/ws")
+async def follow_job(websocket: WebSocket, job_id: str):
+    """Send the job's state every time it changes, until it finishes."""
+    await websocket.accept()
+    last_update = None
+    try:
+        while True:
+            job = await asyncio.to_thread(job_store.get, job_id)
+            if job is None:
+                await websocket.close(code=4404, reason="Job not found")
+                return
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                await websocket.send_json(public_view(job))
+            if job["status"] in FINISHED:
+                await websocket.close()
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+    except WebSocketDisconnect:
+        pass
+
+async def get_doc_content(doc: UploadFile = File(...)):
+    # Stream the upload into a spooled buffer, rejecting files over the size cap
+    with span("upload"):
+        upload = await ingest_upload(doc)
+    try:
+        return await read_document(upload)
+    finally:
+        upload.close()
+
+async def read_document(upload: IngestedUpload, on_pages=None):
+    """Extract the text of an ingested upload, reporting PDF pages to on_pages(done, total)."""
     doc_content = ""
-    
-    # Read file in chunks
-    fileBytes = b''
-    for chunk in iter(lambda: doc.file.read(chunk_size), b''):
-        fileBytes += chunk
+    filename = upload.filename
+
+    # A known file costs one hash pass: skip parsing and OCR entirely
+    # Cached text is normalized; the "normalized" part keeps raw entries from older releases out
+    document_key = make_key("document", upload.sha256, os.path.splitext(filename)[1], "normalized")
+    cached = document_cache.get(document_key)
+    if cached is not None:
+        return cached
 
-    if doc.filename.endswith('.pdf'):
+    if filename.endswith('.pdf'):
         try:
-            pdf_reader = PdfReader(io.BytesIO(fileBytes))
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    doc_content += page_text
-                else:
-                    # Handle scanned PDFs with OCR
-                    pdf_document = fitz.open(stream=fileBytes, filetype="pdf")
-                    page = pdf_document.load_page(page_num)
-                    pix = page.get_pixmap()
-                    img = Image.open(io.BytesIO(pix.tobytes()))
-                    
-                    reader = easyocr.Reader(['en','es'])
-                    ocr_result = reader.readtext(np.array(img))
-                    ocr_text = " ".join([result[1] for result in ocr_result])
-                    doc_content += ocr_text
-                    
-                    pdf_document.close()
+            with span("extract"):
+                doc_content = await extract_pdf_text(upload.source, on_pages)
         except Exception as e:
             raise ValueError(f"Error processing PDF: {str(e)}")
-            
-    elif doc.filename.endswith('.docx'):
+
+    elif filename.endswith('.docx'):
         try:
-            doc = Document(io.BytesIO(fileBytes))
-            for paragraph in doc.paragraphs:
-                doc_content += paragraph.text + "\n"
+            with span("extract"):
+                doc_content = await extract_docx_text(upload.source)
         except Exception as e:
             raise ValueError(f"Error processing DOCX: {str(e)}")
-            
-    elif doc.filename.endswith('.txt'):
-        doc_content = fileBytes.decode('utf-8')
+
+    elif filename.endswith('.txt'):
+        with upload.buffer() as buffer:
+            doc_content = str(buffer, 'utf-8')
     else:
         raise ValueError("Unsupported file format")
 
-    return doc_content    
-async def get_summary(content: str, length: str):
+    doc_content = normalize_content(doc_content)
+    document_cache.set(document_key, doc_content)
+    return doc_content
+
+def normalize_content(content: str) -> str:
+    """Strip boilerplate and extra whitespace before the text reaches the LLM, counting the tokens saved."""
+    with span("normalize"):
+        content, report = normalize_text(content)
+    NORMALIZATION_TOKENS.labels("before").inc(report["tokens_before"])
+    NORMALIZATION_TOKENS.labels("after").inc(report["tokens_after"])
+    return content    
+def summary_messages(content: str, length: str):
+    return [
+        {
+            "role": "system",
+            "content": f"You are an experienced educational assistant with a deep understanding of various subjects and a talent for breaking down complex information into digestible summaries. Your expertise lies in creating summaries that not only condense information but also enhance the student's comprehension and retention of the topic. Your task is to summarize a given text in a way that facilitates the student's learning. Please keep in mind the following aspects while summarizing: - Focus on the key concepts and main ideas.- Use clear and straightforward language suitable for students.- Highlight any important terminology or definitions.- Incorporate examples or analogies if they would aid in understanding. - Your response must be the closest possible to the following length: {length} words and must ONLY contain the summary - DO NOT include any phrase like 'Here is the summary:'."
+        },
+        {
+            "role": "user",
+            "content": f"TEXT TO SUMMARIZE: {content}",
+        }
+    ]
+
+async def summarize_text(content: str, length: str):
     try:
-        chat_completion = summary_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are an experienced educational assistant with a deep understanding of various subjects and a talent for breaking down complex information into digestible summaries. Your expertise lies in creating summaries that not only condense information but also enhance the student's comprehension and retention of the topic. Your task is to summarize a given text in a way that facilitates the student's learning. Please keep in mind the following aspects while summarizing: - Focus on the key concepts and main ideas.- Use clear and straightforward language suitable for students.- Highlight any important terminology or definitions.- Incorporate examples or analogies if they would aid in understanding. - Your response must be the closest possible to the following length: {length} words and must ONLY contain the summary - DO NOT include any phrase like 'Here is the summary:'."
-                },
-                {
-                    "role": "user",
-                    "content": f"TEXT TO SUMMARIZE: {content}",
-                }
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.5,
-            max_completion_tokens=1024,
-            top_p=1,
-            stop=None,
-            stream=False,
-        )
-        return chat_completion.choices[0].message.content
-    except groq.RateLimitError:
-        chat_completion = summary_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are an experienced educational assistant with a deep understanding of various subjects and a talent for breaking down complex information into digestible summaries. Your expertise lies in creating summaries that not only condense information but also enhance the student's comprehension and retention of the topic. Your task is to summarize a given text in a way that facilitates the student's learning. Please keep in mind the following aspects while summarizing: - Focus on the key concepts and main ideas.- Use clear and straightforward language suitable for students.- Highlight any important terminology or definitions.- Incorporate examples or analogies if they would aid in understanding.- Incorporate useful resources like bulleted lists and differenciated paragraphs if needed. - Your response must be the closest possible to the following length: {length} words and must ONLY contain the summary - DO NOT include any phrase like 'Here is the summary:'."
-                },
-                {
-                    "role": "user",
-                    "content": f"TEXT TO SUMMARIZE: {content}",
-                }
-            ],
-            model="llama-70b-8192",
+        chat_completion = await scheduler.complete(
+            summary_client,
+            summary_messages(content, length),
+            priority="summary",
             temperature=0.5,
             max_completion_tokens=1024,
             top_p=1,
             stop=None,
-            stream=False,
         )
         return chat_completion.choices[0].message.content
     except Exception as e:
-        return "There has been an error summarizing the document." + str(e)
+        return SUMMARY_ERROR + str(e)
 
-async def get_questions(content: str, question_number: str, question_difficulty: str):
+async def condense_for_summary(content: str, length: str):
+    # Summarize chunk by chunk, then summarize the summaries, until it fits in one prompt
+    chunks = split_into_chunks(content)
+    while len(chunks) > 1:
+        partials = await map_chunks(chunks, lambda chunk: summarize_text(chunk, length))
+        partials = [p for p in partials if isinstance(p, str) and not p.startswith(SUMMARY_ERROR)]
+        if not partials:
+            return None
+        content = "\n\n".join(partials)
+        chunks = split_into_chunks(content)
+    return content
+
+async def get_summary(content: str, length: str):
+    content = await condense_for_summary(content, length)
+    if content is None:
+        return SUMMARY_ERROR
+    return await summarize_text(content, length)
+
+async def stream_summary(content: str, length: str):
+    """Yield the summary token by token. For long documents only the final pass is streamed."""
+    content = await condense_for_summary(content, length)
+    if content is None:
+        yield SUMMARY_ERROR
+        return
+
+    async for delta in scheduler.stream(
+        summary_client,
+        summary_messages(content, length),
+        priority="summary",
+        temperature=0.5,
+        max_completion_tokens=1024,
+        top_p=1,
+        stop=None,
+    ):
+        yield delta
+
+async def generate_questions(content: str, question_number: str, question_difficulty: str):
     try:
-        chat_completion = questions_client.chat.completions.create(
-            messages=[
+        question_set = await complete_structured(
+            questions_client,
+            [
                 {
                     "role": "system",
-                    "content": f"You are an experienced educational consultant. Format your response EXACTLY as a Python dictionary string: {{'questions': ['question1', 'question2'], 'answers': ['answer1', 'answer2']}}. Generate {question_number} insightful questions with {question_difficulty} difficulty (easy: easy; moderate: moderate; difficult: difficult; further research required: The user will have to research outside the given document for answering. this means the questions should be very thought-provoking; varied: a mix of various difficulties) Include question marks (?) and provide answers for all questions."
+                    "content": f"You are an experienced educational consultant. Format your response EXACTLY as a JSON object: {{\"questions\": [\"question1\", \"question2\"], \"answers\": [\"answer1\", \"answer2\"]}}. Generate {question_number} insightful questions with {question_difficulty} difficulty (easy: easy; moderate: moderate; difficult: difficult; further research required: The user will have to research outside the given document for answering. this means the questions should be very thought-provoking; varied: a mix of various difficulties) Include question marks (?) and provide answers for all questions."
                 },
                 {
                     "role": "user", 
                     "content": f"TEXT TO GENERATE QUESTIONS FROM: {content}"
                 }
             ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.5,
-            max_completion_tokens=1024,
-            top_p=1,
-            stop=None,
-            stream=False
-        )
-        return eval(chat_completion.choices[0].message.content)
-    except groq.RateLimitError:
-        # Same modification for the fallback model
-        chat_completion = questions_client.chat.completions.create(
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are an experienced educational consultant. Format your response EXACTLY as a Python dictionary string: {{'questions': ['question1', 'question2'], 'answers': ['answer1', 'answer2']}}. Generate {question_number} insightful questions with {question_difficulty} difficulty. (easy: easy; moderate: moderate; difficult: difficult; further research required: The user will have to research outside the given document for answering. this means the questions should be very thought-provoking; varied: a mix of various difficulties) Include question marks (?) and provide answers for all questions."
-                },
-                {
-                    "role": "user",
-                    "content": f"TEXT TO GENERATE QUESTIONS FROM: {content}"
-                }
-            ],
-            model="deepseek-r1-distill-llama-70b",
+            QuestionSet,
+            priority="questions",
             temperature=0.5,
             max_completion_tokens=1024,
             top_p=1,
             stop=None,
-            stream=False
         )
-        return eval(chat_completion.choices[0].message.content)
+        return question_set.model_dump()
     except Exception as e:
         print("Error generating questions: ", e)
         return "There has been an error generating questions."
 
-async def get_mindmap(text: str, layout: str, theme: str):
+async def get_questions(content: str, question_number: str, question_difficulty: str):
+    chunks = split_into_chunks(content)
+    if len(chunks) == 1:
+        return await generate_questions(content, question_number, question_difficulty)
+
+    # Ask every chunk for its share of the questions, with a little slack for duplicates
+    try:
+        total = int(question_number)
+    except ValueError:
+        return await generate_questions(content, question_number, question_difficulty)
+    if total < 1:
+        return await generate_questions(content, question_number, question_difficulty)
+    # With more chunks than questions, ask chunks spread across the whole document rather than all of them
+    chunks = pick_evenly(chunks, total)
+    per_chunk = str(math.ceil(total / len(chunks)) + 1)
+    partials = await map_chunks(chunks, lambda chunk: generate_questions(chunk, per_chunk, question_difficulty))
+    partials = [p for p in partials if isinstance(p, dict)]
+    if not partials:
+        return "There has been an error generating questions."
+    return merge_questions(partials, total)
+
+async def get_mindmap_structure(text: str):
     system_prompt = """You are an expert in conceptual analysis and mind map creation. Follow these instructions precisely:
 
                     1. Analyze the provided text and identify the most important key cateogries. DO NOT insert more than 5 categories
@@ -239,17 +469,17 @@ async def get_mindmap(text: str, layout: str, theme: str):
 
                     Return ONLY a valid JSON object with this exact structure:
                     {
-                        'title': {
-                            'text': 'Expanded Mind Map',
-                            'description': 'An example of mindmap'
+                        "title": {
+                            "text": "Expanded Mind Map",
+                            "description": "An example of mindmap"
                         },
-                        'categories': [
+                        "categories": [
                             {
-                                'text': 'Category 1',
-                                'description': 'Description for Category 1',
-                                'subcategories': [
-                                    {'text': 'Subcategory 1.1', 'description': 'Description 1.1'},
-                                    {'text': 'Subcategory 1.2', 'description': 'Description 1.2'}
+                                "text": "Category 1",
+                                "description": "Description for Category 1",
+                                "subcategories": [
+                                    {"text": "Subcategory 1.1", "description": "Description 1.1"},
+                                    {"text": "Subcategory 1.2", "description": "Description 1.2"}
                                 ]
                             }
                         ]
@@ -265,55 +495,244 @@ async def get_mindmap(text: str, layout: str, theme: str):
                     - Maintain consistent relationship directionality
                     - Avoid circular references unless absolutely necessary"""
 
-    try:
-        response = mindmap_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f'{text}'}
-            ],
-            temperature=0.3,
-            max_tokens=1024
-        )
-    except groq.RateLimitError:
-        response = mindmap_client.chat.completions.create(
-            model="llama-70b-8192",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f'{text}'}
-            ],
-            temperature=0.3,
-            max_tokens=1024
-        )
+    mindmap = await complete_structured(
+        mindmap_client,
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f'{text}'}
+        ],
+        MindMap,
+        priority="mindmap",
+        temperature=0.3,
+        max_completion_tokens=1024
+    )
 
-    try:
-        response = re.sub(r'```json\s*|\s*```', '', response.choices[0].message.content)
-        mindmap_data = ast.literal_eval(response)
-    except (AttributeError, json.JSONDecodeError) as e:
-        raise ValueError("Error parsing model response") from e
+    mindmap_data = mindmap.model_dump()
 
-    mindmap_o = create_mind_map(mindmap_data, "mind_map", 300, theme, layout)
+    return mindmap_data
+
+async def get_mindmap_data(text: str):
+    chunks = split_into_chunks(text)
+    if len(chunks) == 1:
+        mindmap_data = await get_mindmap_structure(text)
+    else:
+        partials = await map_chunks(chunks, get_mindmap_structure)
+        structures = [p for p in partials if isinstance(p, dict)]
+        if not structures:
+            raise partials[0]
+        mindmap_data = merge_mind_maps(structures)
+    return mindmap_data
+
+def store_mind_map(mindmap_data) -> str:
+    """Store a mind map structure under an ID derived from its content."""
+    mindmap_id = make_key("mindmap", mindmap_data)[:24]
+    mindmap_store.set(mindmap_id, mindmap_data)
+    return mindmap_id
+
+def remember_mind_map(text: str, mindmap_data) -> str:
+    """Store a document's mind map structure and remember its ID for that document."""
+    mindmap_id = store_mind_map(mindmap_data)
+    result_cache.set(make_key("mindmap_id", hash_text(text)), mindmap_id)
+    return mindmap_id
+
+async def get_mindmap_id(text: str) -> str:
+    """Return the ID of the document's mind map structure, asking the LLM only the first time."""
+    mindmap_id = result_cache.get(make_key("mindmap_id", hash_text(text)))
+    if mindmap_id is not None and mindmap_store.get(mindmap_id) is not None:
+        return mindmap_id
+
+    return remember_mind_map(text, await get_mindmap_data(text))
+
+async def render_stored_mind_map(mindmap_id: str, layout: str, theme: str) -> str:
+    """Render a stored structure in any theme and layout, reusing earlier renders."""
+    key = make_key("render", mindmap_id, theme, layout)
+    cached = render_cache.get(key)
+    if cached is not None:
+        return cached
+
+    mindmap_data = mindmap_store.get(mindmap_id)
+    if mindmap_data is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired mind map")
+
+    # Graphviz runs a subprocess; keep it off the event loop
+    mindmap_o = await render_mind_map(mindmap_data, 300, theme, layout)
+    mindmap_o["id"] = mindmap_id
     
-    return json.dumps(mindmap_o)
+    rendered = json.dumps(mindmap_o)
+    render_cache.set(key, rendered)
+    return rendered
 
-async def process_content(content: str, summary_length: str, question_number: str, question_difficulty: str, analysis_type: str, layout: str, theme: str):
-    tasks = []
-    analysis_order = []
+async def get_mindmap(text: str, layout: str, theme: str):
+    mindmap_id = await get_mindmap_id(text)
+    return await render_stored_mind_map(mindmap_id, layout, theme)
+
+async def get_mindmap_graph(text: str):
+    """Return the mind map as a graph model with positions for every layout, for client-side rendering."""
+    mindmap_id = await get_mindmap_id(text)
+    graph = create_graph_model(mindmap_store.get(mindmap_id))
+    graph["id"] = mindmap_id
+    return json.dumps(graph)
+
+def fused_messages(content: str, analyses, summary_length: str, question_number: str, question_difficulty: str):
+    fields = []
+    if "summary" in analyses:
+        fields.append(f"- \"summary\": a summary that helps a student learn the text. Focus on the key concepts and main ideas, use clear language, highlight important terminology and add examples or analogies where they aid understanding. It must be as close as possible to {summary_length} words and contain ONLY the summary.")
+    if "questions" in analyses:
+        fields.append(f"- \"questions\": {{\"questions\": [\"question1\", \"question2\"], \"answers\": [\"answer1\", \"answer2\"]}} with {question_number} insightful questions with {question_difficulty} difficulty (easy: easy; moderate: moderate; difficult: difficult; further research required: the questions should be very thought-provoking and need research outside the text; varied: a mix of various difficulties), with question marks and an answer for every question.")
+    if "mindmap" in analyses:
+        fields.append("- \"mindmap\": {\"title\": {\"text\": \"...\", \"description\": \"...\"}, \"categories\": [{\"text\": \"...\", \"description\": \"...\", \"subcategories\": [{\"text\": \"...\", \"description\": \"...\"}]}]} with the text's most important concepts: at most 5 categories, at most 3 subcategories per category and at most 3 levels, concise titles (maximum 5 words), descriptions that explain their titles, no repeated concepts.")
+    if "resources" in analyses:
+        fields.append(f"- \"search_queries\": a list of {RESOURCES_QUERIES} concise Google search queries, each covering a different aspect of the text, that would find high-quality resources for deeper investigation. Do not use \"AND\", \"OR\" or parentheses.")
+    instructions = "\n".join(fields)
+    return [
+        {
+            "role": "system",
+            "content": f"You are an experienced educational assistant. Analyze the given text and return ONLY a valid JSON object with these fields:\n{instructions}\nALWAYS answer in the language of the given text."
+        },
+        {
+            "role": "user",
+            "content": f"TEXT TO ANALYZE: {content}"
+        }
+    ]
+
+async def get_fused_analysis(content: str, analyses, summary_length: str, question_number: str, question_difficulty: str) -> FusedAnalysis:
+    """Run every analysis in `analyses` with one LLM call."""
+    return await complete_structured(
+        summary_client,
+        fused_messages(content, analyses, summary_length, question_number, question_difficulty),
+        FusedAnalysis,
+        # Queue as the most urgent of the analyses it stands in for
+        priority=min(analyses, key=lambda analysis: PRIORITIES[analysis]),
+        temperature=0.4,
+        max_completion_tokens=1024 * len(analyses),
+    )
+
+def fuse_analyses(content: str, analyses, summary_length: str, question_number: str, question_difficulty: str):
+    """
+    Route the LLM analyses that aren't cached yet through one shared call.
+    Each analysis takes its part of the combined reply, and falls back to its
+    own call if the combined call fails or leaves its part out.
+    """
+    def is_cached(analysis: str, key: Optional[str]) -> bool:
+        if analysis == "mindmap":
+            return result_cache.get(make_key("mindmap_id", hash_text(content))) is not None
+        return result_cache.get(key) is not None
+
+    pending = [analysis for analysis, key, _ in analyses if analysis in FUSABLE_ANALYSES and not is_cached(analysis, key)]
+    # Documents over one chunk go through the per-analysis map-reduce paths
+    if len(pending) < 2 or len(split_into_chunks(content)) > 1:
+        return analyses
+
+    shared = {}
+
+    async def fused_part(analysis: str, run):
+        if "task" not in shared:
+            shared["task"] = asyncio.ensure_future(
+                get_fused_analysis(content, pending, summary_length, question_number, question_difficulty)
+            )
+        try:
+            # One analysis being cancelled mustn't cancel the call the others share
+            fused = await asyncio.shield(shared["task"])
+        except Exception as e:
+            print(f"Fused analysis failed, falling back to separate calls: {e!r}")
+            return await run()
+
+        if analysis == "summary" and fused.summary:
+            return fused.summary
+        if analysis == "questions" and fused.questions is not None:
+            return fused.questions.model_dump()
+        if analysis == "mindmap" and fused.mindmap is not None:
+            # Stored like any other structure, so the usual run only renders it
+            remember_mind_map(content, fused.mindmap.model_dump())
+        if analysis == "resources" and fused.search_queries:
+            return await search_links(fused.search_queries[:RESOURCES_QUERIES], SEARCH_API, SEARCH_ENGINE_ID)
+        return await run()
+
+    return [
+        (analysis, key, (lambda analysis=analysis, run=run: fused_part(analysis, run)) if analysis in pending else run)
+        for analysis, key, run in analyses
+    ]
+
+def is_cacheable(analysis: str, result) -> bool:
+    # The analysis functions report failures as placeholder values; never cache those
+    if analysis == "summary":
+        return isinstance(result, str) and not result.startswith(SUMMARY_ERROR)
+    if analysis == "questions":
+        return isinstance(result, dict)
+    if analysis == "resources":
+        return bool(result)
+    return True
+
+async def cached_analysis(analysis: str, key: Optional[str], run):
+    # Analyses that manage their own caches pass no key
+    if key is None:
+        with span(analysis):
+            return await run()
+
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with span(analysis):
+        result = await run()
+    if is_cacheable(analysis, result):
+        result_cache.set(key, result)
+    return result
+
+def plan_analyses(content: str, summary_length: str, question_number: str, question_difficulty: str, analysis_type: str, layout: str, theme: str, mindmap_format: str = "svg", fuse: bool = False):
+    """
+    List (analysis, cache key, run) for every analysis requested in analysis_type.
+    With fuse, analyses that need the LLM share one combined call where possible.
+    """
+    analyses = []
+
+    # Results are keyed by the document text plus the parameters each analysis depends on
+    content_hash = hash_text(content)
     
     if "summary" in analysis_type:
-        tasks.append(get_summary(content, summary_length))
-        analysis_order.append("summary")
+        analyses.append((
+            "summary", make_key("summary", content_hash, summary_length),
+            lambda: get_summary(content, summary_length)
+        ))
     if "questions" in analysis_type:
-        tasks.append(get_questions(content, question_number, question_difficulty))
-        analysis_order.append("questions")
-    if "mindmap" in analysis_type:
-        tasks.append(get_mindmap(content, layout, theme))
-        analysis_order.append("mindmap")
+        analyses.append((
+            "questions", make_key("questions", content_hash, question_number, question_difficulty),
+            lambda: get_questions(content, question_number, question_difficulty)
+        ))
+    if "mindmap" in analysis_type and mindmap_format == "graph":
+        # The graph model carries every layout and theme, so neither is part of the key
+        analyses.append((
+            "mindmap", make_key("mindmap_graph", content_hash),
+            lambda: get_mindmap_graph(content)
+        ))
+    elif "mindmap" in analysis_type:
+        # Structures and renders have their own caches, so a theme or layout change only re-renders
+        analyses.append((
+            "mindmap", None,
+            lambda: get_mindmap(content, layout, theme)
+        ))
     if "resources" in analysis_type:
-        tasks.append(text_to_search_links(content, GROQ_TOKEN_RESOURCES, SEARCH_API, SEARCH_ENGINE_ID))
-        analysis_order.append("resources")
+        analyses.append((
+            "resources", make_key("resources", content_hash),
+            lambda: text_to_search_links(content, GROQ_TOKEN_RESOURCES, SEARCH_API, SEARCH_ENGINE_ID)
+        ))
+    if fuse:
+        analyses = fuse_analyses(content, analyses, summary_length, question_number, question_difficulty)
+    return analyses
+
+def format_result(analysis: str, result):
+    """Map an analysis result onto the response fields it fills."""
+    if analysis == "questions":
+        if isinstance(result, str):
+            print("Error generating questions")
+            return {"questions": ['Error']}
+        return {"questions": result['questions'], "answers": result['answers']}
+    return {analysis: result}
+
+async def process_content(content: str, summary_length: str, question_number: str, question_difficulty: str, analysis_type: str, layout: str, theme: str, mindmap_format: str = "svg"):
+    analyses = plan_analyses(content, summary_length, question_number, question_difficulty, analysis_type, layout, theme, mindmap_format, fuse=FUSED_ANALYSES)
         
-    results = await asyncio.gather(*tasks)
+    results = await asyncio.gather(*(cached_analysis(analysis, key, run) for analysis, key, run in analyses))
     
     response = {
         "summary": "",
@@ -323,23 +742,92 @@ async def process_content(content: str, summary_length: str, question_number: st
         "resources": []
     }
     
-    for i, analysis_type in enumerate(analysis_order):
-        if analysis_type == "summary":
-            response["summary"] = results[i]
-        elif analysis_type == "questions":
-            if (type(results[i])==str):
-                console.log("Error generating questions")
-                response["questions"] = ['Error']
-            else:
-                response["questions"] = results[i]['questions']
-                response["answers"] = results[i]['answers']
-        elif analysis_type == "mindmap":
-            response["mindmap"] = results[i]
-        elif analysis_type == "resources":
-            response["resources"] = results[i]
+    for (analysis, _, _), result in zip(analyses, results):
+        response.update(format_result(analysis, result))
             
     return response
+
+async def run_job(job, progress: JobProgress):
+    """Analyze a queued job's document or text, saving each analysis as it finishes."""
+    params = job["params"]
+    if job["document_path"]:
+        upload = await asyncio.to_thread(ingest_file, job["document_path"], params["filename"])
+        try:
+            content = await read_document(upload, progress.pages)
+        finally:
+            upload.close()
+    else:
+        content = normalize_content(params["text"])
+
+    analyses = plan_analyses(content, params["summary_length"], params["question_number"], params["question_difficulty"], params["analysis_type"], params["layout"], params["theme"], params["mindmap_format"], fuse=FUSED_ANALYSES)
+    progress.analyses([analysis for analysis, _, _ in analyses])
+
+    async def run_analysis(analysis: str, key: Optional[str], run):
+        try:
+            result = await cached_analysis(analysis, key, run)
+            progress.analysis_done(analysis, format_result(analysis, result))
+        except Exception as e:
+            progress.analysis_failed(analysis, str(e))
+
+    await asyncio.gather(*(run_analysis(*analysis) for analysis in analyses))
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_content(content: str, summary_length: str, question_number: str, question_difficulty: str, analysis_type: str, layout: str, theme: str, mindmap_format: str = "svg"):
+    """
+    Yield Server-Sent Events for each analysis as soon as it completes.
+
+    Summary tokens are sent as `summary_delta` events while they arrive; every
+    analysis then sends one event named after it carrying the same fields as
+    the /analyze-content response. Failures send an `error` event and the
+    stream ends with `done`.
+    """
+    analyses = plan_analyses(content, summary_length, question_number, question_difficulty, analysis_type, layout, theme, mindmap_format)
+    events = asyncio.Queue()
+
+    async def run_summary(key: str):
+        cached = result_cache.get(key)
+        if cached is not None:
+            return cached
+        parts = []
+        async for delta in stream_summary(content, summary_length):
+            parts.append(delta)
+            await events.put(("summary_delta", {"text": delta}))
+        result = "".join(parts)
+        if is_cacheable("summary", result):
+            result_cache.set(key, result)
+        return result
+
+    async def run_analysis(analysis: str, key: str, run):
+        try:
+            if analysis == "summary":
+                result = await run_summary(key)
+            else:
+                result = await cached_analysis(analysis, key, run)
+            await events.put((analysis, format_result(analysis, result)))
+        except Exception as e:
+            await events.put(("error", {"analysis": analysis, "detail": str(e)}))
+
+    tasks = [asyncio.create_task(run_analysis(*analysis)) for analysis in analyses]
+    try:
+        pending = len(tasks)
+        while pending:
+            event, data = await events.get()
+            if event != "summary_delta":
+                pending -= 1
+            yield sse_event(event, data)
+        yield sse_event("done", {})
+    finally:
+        # The client may disconnect mid-stream; don't leave analyses running
+        for task in tasks:
+            task.cancel()
+
 if __name__ == "__main__":
     import uvicorn
-    
+    from ocr_service import OCR_SIDECAR, start_sidecar
+
+    if OCR_SIDECAR:
+        # One OCR process shared by all the workers below
+        start_sidecar()
     uvicorn.run("server:app", host="0.0.0.0", port=PORT, workers=4, limit_concurrency=50)
@@ -0,0 +1,84 @@
+"""
+Startup timing and warm-up.
+
+ImportTimer records how long each module imported at startup takes to load,
+including everything it imports in turn, so slow dependencies show up in the
+startup report. Heavy dependencies (PyMuPDF, easyocr and torch, NumPy, the
+Google client) are imported on first use instead of at startup. Deployments
+that would rather pay that cost before the first request can list features
+in WARMUP, e.g. WARMUP=extraction,ocr,mindmap,search, to load them in the
+background as soon as the worker starts.
+"""
+
+import builtins
+import os
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List
+
+WARMUP = [feature.strip() for feature in os.getenv('WARMUP', '').split(',') if feature.strip()]
+
+PROCESS_STARTED = time.perf_counter()
+
+
+class ImportTimer:
+    """
+    Times the outermost import of every module not yet loaded while active.
+    Nested imports are included in the time of the import that triggered them.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._original_import = None
+        self._depth = 0
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if self._depth or level or name in sys.modules:
+            return self._original_import(name, globals, locals, fromlist, level)
+        started = time.perf_counter()
+        self._depth += 1
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            self._depth -= 1
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    def start(self) -> None:
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._import
+
+    def stop(self) -> None:
+        builtins.__import__ = self._original_import
+
+
+async def run_warmup(hooks: Dict[str, Callable[[], Awaitable[None]]], features: List[str] = WARMUP) -> Dict[str, float]:
+    """
+    Run the warm-up hooks for the configured features.
+
+    Returns:
+        Seconds spent warming each feature
+    """
+    timings = {}
+    for feature in features:
+        hook = hooks.get(feature)
+        if hook is None:
+            print(f"Unknown warm-up feature: {feature}")
+            continue
+        started = time.perf_counter()
+        try:
+            await hook()
+        except Exception as e:
+            print(f"Warm-up of {feature} failed: {e!r}")
+        timings[feature] = round(time.perf_counter() - started, 4)
+    return timings
+
+
+def startup_report(import_timer: ImportTimer, ready_at: float, warmup: Dict[str, float]) -> Dict:
+    """Summarize import times, time to ready and warm-up times for this worker."""
+    imports = sorted(import_timer.timings.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "pid": os.getpid(),
+        "ready_seconds": round(ready_at - PROCESS_STARTED, 4),
+        "imports": {name: round(seconds, 4) for name, seconds in imports},
+        "warmup": warmup,
+    }
@@ -0,0 +1,215 @@
+"""
+Structured output for LLM responses.
+
+Analyses that expect structured data request Groq's JSON mode and validate
+the reply against a pydantic schema. Replies that still come back malformed
+are repaired instead of re-requested: code fences and surrounding prose are
+dropped, Python-style literals are converted to JSON, and output cut off by
+the token limit is trimmed back to its last complete value and closed.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Type, TypeVar
+
+import groq
+from pydantic import BaseModel, ValidationError, model_validator
+
+from llm import scheduler
+
+T = TypeVar('T', bound=BaseModel)
+
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+CODE_FENCE = re.compile(r'```(?:json|python)?')
+
+
+class QuestionSet(BaseModel):
+    questions: List[str]
+    answers: List[str]
+
+    @model_validator(mode='after')
+    def pair_questions_with_answers(self) -> "QuestionSet":
+        # A truncated reply can lose the last answers; keep only complete pairs
+        pairs = min(len(self.questions), len(self.answers))
+        if pairs == 0:
+            raise ValueError("No complete question and answer pairs")
+        self.questions = self.questions[:pairs]
+        self.answers = self.answers[:pairs]
+        return self
+
+
+class MindMapNode(BaseModel):
+    text: str
+    description: str = ""
+    subcategories: List["MindMapNode"] = []
+
+
+class MindMapTitle(BaseModel):
+    text: str
+    description: str = ""
+
+
+class MindMap(BaseModel):
+    title: MindMapTitle
+    categories: List[MindMapNode]
+
+
+class FusedAnalysis(BaseModel):
+    """Every analysis of one document, requested in a single call. Fields not requested stay None."""
+    summary: Optional[str] = None
+    questions: Optional[QuestionSet] = None
+    mindmap: Optional[MindMap] = None
+    search_queries: Optional[List[str]] = None
+
+
+def repair_json(raw: str) -> str:
+    """
+    Turn an almost-JSON LLM reply into JSON in one linear pass.
+
+    Handles single-quoted strings, True/False/None, trailing commas, raw
+    newlines in strings and output truncated mid-value.
+    """
+    text = CODE_FENCE.sub('', raw)
+    start = min((i for i in (text.find('{'), text.find('[')) if i != -1), default=-1)
+    if start == -1:
+        return text.strip()
+    text = text[start:]
+
+    out: List[str] = []
+    stack: List[str] = []
+    # Whether each open object is past its key's colon and expecting a value
+    expecting_value: List[bool] = []
+    # (output length, open containers) after the last complete value
+    safe_point = None
+    quote = None
+    escaped = False
+    word: List[str] = []
+
+    def mark_safe() -> None:
+        nonlocal safe_point
+        safe_point = (len(out), list(stack))
+
+    def in_value_position() -> bool:
+        return bool(stack) and (stack[-1] == '[' or expecting_value[-1])
+
+    def flush_word() -> None:
+        if word:
+            token = ''.join(word)
+            out.append(PYTHON_LITERALS.get(token, token))
+            word.clear()
+            if in_value_position():
+                mark_safe()
+
+    for char in text:
+        if quote:
+            if escaped:
+                escaped = False
+                # \' is valid in Python strings but not in JSON
+                out.append("'" if char == "'" else '\\' + char)
+            elif char == '\\':
+                escaped = True
+            elif char == quote:
+                quote = None
+                out.append('"')
+                if in_value_position():
+                    mark_safe()
+            elif char == '"':
+                out.append('\\"')
+            elif char == '\n':
+                out.append('\\n')
+            else:
+                out.append(char)
+            continue
+
+        if char.isalnum() or char in '.-+_':
+            word.append(char)
+            continue
+        flush_word()
+
+        if char in '"\'':
+            quote = char
+            out.append('"')
+        elif char in '{[':
+            stack.append(char)
+            expecting_value.append(False)
+            out.append(char)
+        elif char in '}]':
+            if not stack:
+                break
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ',':
+                out.pop()
+            stack.pop()
+            expecting_value.pop()
+            out.append(char)
+            if not stack:
+                return ''.join(out)
+            if in_value_position():
+                mark_safe()
+        elif char == ':':
+            if stack:
+                expecting_value[-1] = True
+            out.append(char)
+        elif char == ',':
+            if stack and stack[-1] == '{':
+                expecting_value[-1] = False
+            out.append(char)
+        else:
+            out.append(char)
+
+    # The reply ended before the top-level value closed: cut back to the last
+    # complete value and close whatever was open at that point. A word still
+    # being read may be cut short ("tr", or 12 of 125), so it isn't kept.
+    if safe_point is None:
+        # Nothing was complete: close the top-level container empty
+        return '{}' if text[0] == '{' else '[]'
+    length, open_containers = safe_point
+    repaired = ''.join(out[:length]).rstrip().rstrip(',')
+    return repaired + ''.join('}' if c == '{' else ']' for c in reversed(open_containers))
+
+
+def parse_structured(raw: str, schema: Type[T]) -> T:
+    """
+    Parse an LLM reply into a schema, repairing it if needed.
+
+    Raises:
+        ValueError: If the reply can't be parsed or doesn't match the schema
+    """
+    try:
+        return schema.model_validate_json(raw)
+    except ValidationError:
+        pass
+    try:
+        return schema.model_validate(json.loads(repair_json(raw), strict=False))
+    except (ValidationError, json.JSONDecodeError) as e:
+        raise ValueError(f"Model response doesn't match {schema.__name__}") from e
+
+
+def failed_generation(error: groq.BadRequestError) -> Optional[str]:
+    """Return the reply Groq rejected in JSON mode, if the error carries it."""
+    body: Any = error.body
+    if isinstance(body, dict):
+        body = body.get('error', body)
+    if isinstance(body, dict) and body.get('code') == 'json_validate_failed':
+        return body.get('failed_generation')
+    return None
+
+
+async def complete_structured(client, messages: List[Dict[str, str]], schema: Type[T],
+                              priority: str = "default", **kwargs) -> T:
+    """
+    Request a JSON-mode completion through the scheduler and parse it into `schema`.
+    When Groq rejects the reply as invalid JSON, the rejected text is repaired
+    instead of asking again.
+    """
+    try:
+        completion = await scheduler.complete(
+            client, messages, priority=priority, response_format={"type": "json_object"}, **kwargs
+        )
+        raw = completion.choices[0].message.content
+    except groq.BadRequestError as e:
+        raw = failed_generation(e)
+        if raw is None:
+            raise
+    return parse_structured(raw, schema)
@@ -0,0 +1,15 @@
+"""
+The server modules import each other by their bare names, as when the
+server runs from this directory. Run the tests from here too:
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# server.py creates its Groq clients at import time, and they need a key, though tests never call them
+for key in ("GROQ_RESTUDY_SUMMARY", "GROQ_RESTUDY_QUESTIONS", "GROQ_RESTUDY_MINDMAP", "GROQ_RESTUDY_RESOURCES"):
+    os.environ.setdefault(key, "test")
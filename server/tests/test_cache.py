@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+import cache  # noqa: E402
+from cache import MemoryCache, SQLiteCache, make_cache  # noqa: E402
+
+
+def test_memory_cache_evicts_least_recently_used():
+    entries = MemoryCache(max_entries=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+    assert entries.get("a") == 1 and entries.get("b") is None and entries.get("c") == 3
+
+
+def test_memory_cache_evicts_by_size():
+    entries = MemoryCache(max_entries=100, max_bytes=10)
+    entries.set("a", "12345")
+    entries.set("b", "12345")
+    entries.set("c", "1")
+    assert entries.get("a") is None and entries.get("b") == "12345" and entries.get("c") == "1"
+    # Too big to ever fit: dropped rather than emptying the cache
+    entries.set("b", "x" * 20)
+    assert entries.get("b") is None and entries.get("c") == "1"
+    entries.delete("c")
+    assert entries._bytes == 0
+
+
+def test_memory_cache_expires_entries():
+    entries = MemoryCache(ttl=-1)
+    entries.set("a", 1)
+    assert entries.get("a") is None
+
+
+def test_shared_caches_use_sqlite_whatever_the_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(cache, "CACHE_PATH", str(tmp_path / "cache.sqlite3"))
+    assert isinstance(make_cache("local").backend, MemoryCache)
+    writer = make_cache("shared", shared=True)
+    reader = make_cache("shared", shared=True)
+    assert isinstance(writer.backend, SQLiteCache)
+    writer.set("id", {"title": "map"})
+    assert reader.get("id") == {"title": "map"}
+
+
+def test_sqlite_reads_only_touch_stale_access_times(tmp_path, monkeypatch):
+    entries = SQLiteCache(str(tmp_path / "cache.sqlite3"), namespace="touch")
+    entries.set("a", 1)
+    connection = entries._connect()
+
+    def accessed_at():
+        return connection.execute("SELECT accessed_at FROM touch WHERE key = 'a'").fetchone()[0]
+
+    written = accessed_at()
+    assert entries.get("a") == 1
+    assert accessed_at() == written
+
+    connection.execute("UPDATE touch SET accessed_at = accessed_at - ?", (cache.CACHE_TOUCH_SECONDS + 1,))
+    assert entries.get("a") == 1
+    assert accessed_at() > written - 1
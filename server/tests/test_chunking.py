@@ -0,0 +1,97 @@
+import asyncio
+
+from chunking import (CHARS_PER_TOKEN, estimate_tokens, map_chunks, merge_mind_maps, merge_questions,
+                      pick_evenly, sample_text, split_into_chunks)
+
+
+def paragraphs(count: int, words: int = 50) -> str:
+    return "\n\n".join(" ".join(f"p{i}w{j}" for j in range(words)) for i in range(count))
+
+
+def test_short_text_is_one_chunk():
+    assert split_into_chunks("short text", max_tokens=100) == ["short text"]
+
+
+def test_chunks_respect_the_token_budget_and_keep_every_paragraph():
+    text = paragraphs(40)
+    chunks = split_into_chunks(text, max_tokens=200)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 * CHARS_PER_TOKEN for chunk in chunks)
+    assert "\n\n".join(chunks).split() == text.split()
+
+
+def test_chunks_split_on_pages():
+    pages = [paragraphs(3) for _ in range(4)]
+    chunks = split_into_chunks("\f".join(pages), max_tokens=estimate_tokens(pages[0]) + 1)
+    assert chunks == pages
+
+
+def test_oversized_paragraphs_are_cut():
+    text = "x" * 5000
+    chunks = split_into_chunks(text, max_tokens=100)
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_pick_evenly_spans_first_to_last():
+    items = list(range(41))
+    picked = pick_evenly(items, 10)
+    assert len(picked) == 10
+    assert picked[0] == 0 and picked[-1] == 40
+    assert picked == sorted(set(picked))
+    assert pick_evenly(items, 50) == items
+    assert pick_evenly(items, 1) == [0]
+    assert pick_evenly(items, 0) == []
+
+
+def test_sample_text_covers_the_end_of_the_document():
+    text = paragraphs(200)
+    sampled = sample_text(text, 500)
+    assert estimate_tokens(sampled) <= 500 * 1.1
+    assert "p0w0" in sampled
+    assert "p199w49" in sampled
+
+
+def test_map_chunks_keeps_order_and_returns_exceptions():
+    async def analyse(chunk):
+        if chunk == "bad":
+            raise ValueError(chunk)
+        await asyncio.sleep(0.01 * (3 - len(chunk)))
+        return chunk.upper()
+
+    results = asyncio.run(map_chunks(["a", "bad", "cc"], analyse, concurrency=2))
+    assert results[0] == "A" and results[2] == "CC"
+    assert isinstance(results[1], ValueError)
+
+
+def question_set(chunk: int, count: int = 2) -> dict:
+    return {"questions": [f"Question {chunk}.{i}?" for i in range(count)],
+            "answers": [f"Answer {chunk}.{i}" for i in range(count)]}
+
+
+def test_merge_questions_takes_round_robin_and_drops_duplicates():
+    partials = [question_set(0, 3), {"questions": ["question 0.0"], "answers": ["dup"]}, question_set(2, 3)]
+    merged = merge_questions(partials, 4)
+    assert merged["questions"] == ["Question 0.0?", "Question 2.0?", "Question 0.1?", "Question 2.1?"]
+    assert merged["answers"] == ["Answer 0.0", "Answer 2.0", "Answer 0.1", "Answer 2.1"]
+
+
+def test_questions_cover_the_whole_document_when_chunks_outnumber_them():
+    chunks = list(range(41))
+    picked = pick_evenly(chunks, 10)
+    merged = merge_questions([question_set(chunk) for chunk in picked], 10)
+    sources = {int(question.split()[1].split(".")[0]) for question in merged["questions"]}
+    assert len(merged["questions"]) == 10
+    assert min(sources) == 0 and max(sources) == 40
+
+
+def test_merge_mind_maps_combines_categories_by_title():
+    def category(text, subs):
+        return {"text": text, "description": "", "subcategories": [{"text": s, "description": ""} for s in subs]}
+
+    first = {"title": {"text": "T"}, "categories": [category("Cells", ["Neurons"]), category("Rare", [])]}
+    second = {"title": {"text": "Other"}, "categories": [category("cells", ["Glia", "neurons"])]}
+    merged = merge_mind_maps([first, second], max_categories=1)
+    assert merged["title"] == {"text": "T"}
+    assert [c["text"] for c in merged["categories"]] == ["Cells"]
+    assert [s["text"] for s in merged["categories"][0]["subcategories"]] == ["Neurons", "Glia"]
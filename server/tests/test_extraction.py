@@ -0,0 +1,63 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+pytest.importorskip("prometheus_client")
+
+import extraction  # noqa: E402
+from cache import CountingCache, MemoryCache  # noqa: E402
+
+
+def make_pdf() -> bytes:
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), "A page with a text layer")
+    scanned = document.new_page()
+    # Drawn shapes stand in for a scanned page: ink, but no text layer
+    for row in range(10):
+        scanned.draw_rect(fitz.Rect(72, 72 + row * 30, 500, 90 + row * 30), color=(0, 0, 0), fill=(0, 0, 0))
+    document.new_page()
+    return document.tobytes()
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=2)
+    rendered, recognized = [], []
+    render_pages = extraction._render_pages
+
+    def counting_render(source, page_nums):
+        rendered.extend(page_nums)
+        return render_pages(source, page_nums)
+
+    async def recognize(images):
+        recognized.extend(images)
+        return ["recognized text" for _ in images]
+
+    monkeypatch.setattr(extraction, "_get_text_pool", lambda: pool)
+    monkeypatch.setattr(extraction, "_render_pages", counting_render)
+    monkeypatch.setattr(extraction, "_recognize", recognize)
+    monkeypatch.setattr(extraction, "page_cache", CountingCache(MemoryCache(), "pages"))
+    yield rendered, recognized
+    pool.shutdown()
+
+
+def test_only_pages_missing_from_the_cache_are_rendered(pipeline):
+    rendered, recognized = pipeline
+    pdf = make_pdf()
+
+    text = asyncio.run(extraction.extract_pdf_text(pdf))
+    pages = text.split("\f")
+    assert "A page with a text layer" in pages[0]
+    assert pages[1] == "recognized text"
+    assert pages[2] == ""
+    # The scanned and the blank page are rendered; only the scanned one is OCR'd
+    assert rendered == [1, 2] and len(recognized) == 1
+
+    rendered.clear()
+    recognized.clear()
+    assert asyncio.run(extraction.extract_pdf_text(pdf)) == text
+    assert rendered == [] and recognized == []
@@ -0,0 +1,121 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+server = pytest.importorskip("server")
+
+import structured  # noqa: E402
+from cache import CountingCache, MemoryCache  # noqa: E402
+
+CONTENT = "Photosynthesis turns light, water and carbon dioxide into sugar and oxygen inside chloroplasts."
+
+REPLY = {
+    "summary": "Plants make sugar from light.",
+    "questions": {"questions": ["Where does photosynthesis happen?"], "answers": ["In chloroplasts."]},
+    "mindmap": {
+        "title": {"text": "Photosynthesis", "description": "How plants make food"},
+        "categories": [{"text": "Inputs", "description": "Light, water, CO2", "subcategories": []}],
+    },
+    "search_queries": ["photosynthesis light reactions", "chloroplast structure"],
+}
+
+
+@pytest.fixture
+def fused(monkeypatch):
+    """Enable fused mode with a stubbed LLM; returns the fused prompts sent and the separate calls made."""
+    prompts, separate = [], []
+    replies = []
+
+    async def complete(client, messages, **kwargs):
+        prompts.append(messages[0]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=replies.pop(0)))])
+
+    async def render_mind_map(data, dpi, theme, layout):
+        return {"svg": f"<svg>{data['title']['text']}</svg>"}
+
+    async def search_links(queries, api_key, engine_id):
+        return [f"https://example.com/{query.replace(' ', '-')}" for query in queries]
+
+    def separate_call(analysis, result):
+        async def run(*args, **kwargs):
+            separate.append(analysis)
+            return result
+        return run
+
+    monkeypatch.setattr(server, "FUSED_ANALYSES", True)
+    monkeypatch.setattr(structured.scheduler, "complete", complete)
+    monkeypatch.setattr(server, "result_cache", CountingCache(MemoryCache(), "results"))
+    monkeypatch.setattr(server, "mindmap_store", CountingCache(MemoryCache(), "mindmaps"))
+    monkeypatch.setattr(server, "render_cache", CountingCache(MemoryCache(), "renders"))
+    monkeypatch.setattr(server, "render_mind_map", render_mind_map)
+    monkeypatch.setattr(server, "search_links", search_links)
+    monkeypatch.setattr(server, "get_summary", separate_call("summary", "Separate summary"))
+    monkeypatch.setattr(server, "get_questions", separate_call(
+        "questions", {"questions": ["Separate question?"], "answers": ["Separate answer"]}))
+    monkeypatch.setattr(server, "get_mindmap_data", separate_call("mindmap", {
+        "title": {"text": "Separate map", "description": ""}, "categories": []}))
+    monkeypatch.setattr(server, "text_to_search_links", separate_call("resources", ["https://example.com/separate"]))
+    return replies, prompts, separate
+
+
+def analyze():
+    return asyncio.run(server.process_content(
+        CONTENT, "100", "1", "easy", "summary,questions,mindmap,resources", "radial", "dark"))
+
+
+def test_one_combined_reply_is_split_between_the_analyses(fused):
+    replies, prompts, separate = fused
+    replies.append(json.dumps(REPLY))
+    response = analyze()
+
+    assert len(prompts) == 1 and separate == []
+    for field in ('"summary"', '"questions"', '"mindmap"', '"search_queries"'):
+        assert field in prompts[0]
+    assert response["summary"] == "Plants make sugar from light."
+    assert response["questions"] == ["Where does photosynthesis happen?"]
+    assert response["answers"] == ["In chloroplasts."]
+    assert json.loads(response["mindmap"])["svg"] == "<svg>Photosynthesis</svg>"
+    assert response["resources"] == [
+        "https://example.com/photosynthesis-light-reactions",
+        "https://example.com/chloroplast-structure",
+    ][:server.RESOURCES_QUERIES]
+
+
+def test_analyses_missing_from_the_reply_make_their_own_calls(fused):
+    replies, prompts, separate = fused
+    replies.append(json.dumps({key: value for key, value in REPLY.items() if key not in ("questions", "mindmap")}))
+    response = analyze()
+
+    assert len(prompts) == 1
+    assert sorted(separate) == ["mindmap", "questions"]
+    assert response["summary"] == "Plants make sugar from light."
+    assert response["questions"] == ["Separate question?"]
+    assert json.loads(response["mindmap"])["svg"] == "<svg>Separate map</svg>"
+    assert response["resources"][0] == "https://example.com/photosynthesis-light-reactions"
+
+
+def test_an_invalid_reply_falls_back_to_separate_calls(fused):
+    replies, prompts, separate = fused
+    replies.append(json.dumps({**REPLY, "questions": {"questions": "not a list"}}))
+    response = analyze()
+
+    assert len(prompts) == 1
+    assert sorted(separate) == ["mindmap", "questions", "resources", "summary"]
+    assert response["summary"] == "Separate summary"
+    assert response["resources"] == ["https://example.com/separate"]
+
+
+def test_cached_analyses_are_left_out_of_the_combined_call(fused):
+    replies, prompts, separate = fused
+    replies.append(json.dumps(REPLY))
+    analyze()
+    server.result_cache.delete(server.make_key("summary", server.hash_text(CONTENT), "100"))
+    replies.append(json.dumps({"summary": "Plants make sugar from light."}))
+    response = analyze()
+
+    # Only the summary is left, and one analysis isn't worth a combined call
+    assert len(prompts) == 1 and separate == ["summary"]
+    assert response["summary"] == "Separate summary"
@@ -0,0 +1,117 @@
+import asyncio
+import sqlite3
+import time
+
+import jobs
+from jobs import JobStore, job_loop
+
+
+def make_store(tmp_path, **kwargs) -> JobStore:
+    return JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "documents"), **kwargs)
+
+
+def expire_lease(store: JobStore, job_id: str) -> None:
+    store._connect().execute("UPDATE jobs SET lease_expires_at = 0 WHERE id = ?", (job_id,))
+
+
+def test_jobs_are_claimed_oldest_first_and_only_once(tmp_path):
+    store = make_store(tmp_path)
+    store.create("first", {})
+    store.create("second", {})
+    assert store.claim()["id"] == "first"
+    assert store.claim()["id"] == "second"
+    assert store.claim() is None
+
+
+def test_expired_leases_are_reclaimed_until_max_attempts(tmp_path):
+    store = make_store(tmp_path, max_attempts=2)
+    path = store.document_path("job", ".pdf")
+    with open(path, "wb") as document:
+        document.write(b"%PDF")
+    store.create("job", {}, path)
+
+    assert store.claim()["attempts"] == 0
+    expire_lease(store, "job")
+    assert store.claim()["attempts"] == 1
+    expire_lease(store, "job")
+    assert store.claim() is None
+
+    job = store.get("job")
+    assert job["status"] == "failed"
+    assert "2 attempts" in job["error"]
+    assert not (tmp_path / "documents" / "job.pdf").exists()
+
+
+def test_released_jobs_do_not_use_up_attempts(tmp_path):
+    store = make_store(tmp_path, max_attempts=1)
+    store.create("job", {})
+    store.claim()
+    store.release("job")
+    assert store.claim()["id"] == "job"
+
+
+def test_exceptions_without_a_message_still_fail_the_job(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.01)
+    store = make_store(tmp_path)
+    store.create("job", {})
+
+    async def handler(job, progress):
+        raise RuntimeError()
+
+    async def run():
+        loop = asyncio.create_task(job_loop(store, handler))
+        while store.get("job")["status"] not in jobs.FINISHED:
+            await asyncio.sleep(0.01)
+        loop.cancel()
+
+    asyncio.run(run())
+    job = store.get("job")
+    assert job["status"] == "failed"
+    assert job["error"] == "RuntimeError()"
+
+
+def test_finishing_with_an_empty_error_counts_as_failed(tmp_path):
+    store = make_store(tmp_path)
+    store.create("job", {})
+    store.finish("job", error="")
+    assert store.get("job")["status"] == "failed"
+
+
+def test_idle_claims_do_not_wait_for_the_write_lock(tmp_path):
+    store = make_store(tmp_path)
+    writer = sqlite3.connect(store.path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        assert store.claim() is None
+        assert time.monotonic() - started < 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+
+def test_progress_is_saved_in_order_before_the_job_finishes(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.01)
+    store = make_store(tmp_path)
+    store.create("job", {})
+
+    async def handler(job, progress):
+        progress.analyses(["summary", "questions"])
+        for page in range(1, 21):
+            progress.pages(page, 20)
+        progress.analysis_done("summary", {"summary": "Short"})
+        await asyncio.sleep(0)
+        progress.analysis_failed("questions", "Rate limited")
+
+    async def run():
+        loop = asyncio.create_task(job_loop(store, handler))
+        while store.get("job")["status"] not in jobs.FINISHED:
+            await asyncio.sleep(0.01)
+        loop.cancel()
+
+    asyncio.run(run())
+    job = store.get("job")
+    assert job["status"] == "done"
+    assert job["progress"] == {"pages_done": 20, "pages_total": 20,
+                               "analyses": {"summary": "done", "questions": "failed"}}
+    assert job["results"] == {"summary": "Short", "errors": {"questions": "Rate limited"}}
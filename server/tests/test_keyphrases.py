@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from keyphrases import extract_keyphrases, keyphrase_search_queries  # noqa: E402
+
+TEXT = """Neural networks learn patterns from data. A neural network is built from layers of artificial neurons.
+Each artificial neuron sums weighted inputs. Training a neural network adjusts the weights with gradient descent.
+Gradient descent follows the gradient of the loss. Neural networks power image recognition and speech recognition."""
+
+
+def test_top_keyphrases_of_a_fixed_text():
+    phrases = [phrase for phrase, _ in extract_keyphrases(TEXT, top_n=5)]
+    assert len(phrases) == 5
+    assert all(phrase.startswith("neural network") for phrase in phrases[:4])
+    assert "gradient descent follows" in phrases
+    scores = [score for _, score in extract_keyphrases(TEXT, top_n=5)]
+    assert scores == sorted(scores, reverse=True)
+    assert extract_keyphrases(TEXT, top_n=5) == extract_keyphrases(TEXT, top_n=5)
+
+
+def test_stopwords_and_numbers_are_never_keyphrases():
+    assert extract_keyphrases("the of and 123 456 a an", top_n=3) == []
+    assert keyphrase_search_queries("", 2) == []
+
+
+@pytest.mark.parametrize("count", [1, 2, 3])
+def test_search_queries_respect_count_and_length(count):
+    queries = keyphrase_search_queries(TEXT, count, max_words=8)
+    assert len(queries) == count
+    assert len(set(queries)) == count
+    for query in queries:
+        words = query.split()
+        assert 0 < len(words) <= 8
+        assert len(set(words)) == len(words)
+    assert "neural" in queries[0]
+
+
+class TestLocalFallback:
+    @pytest.fixture
+    def resources(self):
+        pytest.importorskip("groq")
+        pytest.importorskip("prometheus_client")
+        pytest.importorskip("dotenv")
+        import resources
+        return resources
+
+    def test_local_search_phrases(self, resources):
+        assert resources.local_search_phrases(TEXT, 2) == keyphrase_search_queries(TEXT, 2)
+        # Without keyphrases, the start of the text stands in
+        assert resources.local_search_phrases("the of and 123", 1) == ["the of and 123"]
+
+    def test_groq_failures_fall_back_to_keyphrases(self, resources, monkeypatch):
+        async def complete(*args, **kwargs):
+            raise RuntimeError("Groq is down")
+
+        monkeypatch.setattr(resources.scheduler, "complete", complete)
+        phrases = asyncio.run(resources.generate_search_phrases_with_groq(TEXT, "key", 2))
+        assert phrases == keyphrase_search_queries(TEXT, 2)
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import pytest
+
+groq = pytest.importorskip("groq")
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("prometheus_client")
+
+from llm import LLMScheduler, PriorityGate, TokenBucket, parse_duration  # noqa: E402
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("7.66s", 7.66),
+    ("2m59.56s", 179.56),
+    ("300ms", 0.3),
+    ("1h2m", 3720),
+    ("12", 12),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds) if seconds is not None else parse_duration(value) is None
+
+
+def test_token_bucket_waits_for_the_tokens_reset():
+    bucket = TokenBucket()
+    assert bucket.wait_time(1000, now=0.0) == 0.0
+    bucket.update({"x-ratelimit-remaining-tokens": "500", "x-ratelimit-reset-tokens": "2s",
+                   "x-ratelimit-remaining-requests": "10", "x-ratelimit-reset-requests": "1m"}, now=100.0)
+    assert bucket.wait_time(400, now=100.0) == 0.0
+    assert bucket.wait_time(1000, now=100.5) == pytest.approx(1.5)
+    bucket.reserve(400, now=100.5)
+    assert bucket.remaining_tokens == 100 and bucket.remaining_requests == 9
+    # Past the reset, the local counts are stale and forgotten
+    bucket.reserve(400, now=103.0)
+    assert bucket.remaining_tokens is None
+    assert bucket.wait_time(1000, now=103.0) == 0.0
+
+
+def test_token_bucket_honours_retry_after_and_request_limits():
+    bucket = TokenBucket()
+    bucket.update({"retry-after": "3", "x-ratelimit-remaining-requests": "0",
+                   "x-ratelimit-reset-requests": "5s"}, now=10.0)
+    assert bucket.wait_time(1, now=10.0) == pytest.approx(5.0)
+    assert bucket.wait_time(1, now=14.0) == pytest.approx(1.0)
+
+
+def test_priority_gate_serves_lowest_priority_value_first():
+    async def run():
+        gate = PriorityGate(1)
+        await gate.acquire(0)
+        order = []
+
+        async def waiter(priority, name):
+            await gate.acquire(priority)
+            order.append(name)
+            gate.release()
+
+        tasks = [asyncio.create_task(waiter(3, "resources")), asyncio.create_task(waiter(0, "summary")),
+                 asyncio.create_task(waiter(3, "resources again"))]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["summary", "resources", "resources again"]
+
+
+class FakeClient:
+    """Answers like AsyncGroq's raw-response API, rate limiting the first `limited` calls."""
+
+    def __init__(self, api_key: str = "test", limited: int = 0, retry_after: float = 0.0, latency: float = 0.0):
+        self.api_key = api_key
+        self.limited = limited
+        self.retry_after = retry_after
+        self.latency = latency
+        self.calls = []
+        self.chat = self
+        self.completions = self
+        self.with_raw_response = self
+
+    async def create(self, **kwargs):
+        self.calls.append((kwargs["messages"][0]["content"], time.monotonic()))
+        await asyncio.sleep(self.latency)
+        if self.limited:
+            self.limited -= 1
+            response = httpx.Response(429, headers={"retry-after": str(self.retry_after)},
+                                      request=httpx.Request("POST", "https://api.groq.com"))
+            raise groq.RateLimitError("Rate limit reached", response=response, body=None)
+        return FakeRaw(kwargs["messages"][0]["content"])
+
+
+class FakeRaw:
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def parse(self):
+        return self.content
+
+
+def test_rate_limited_calls_release_their_slot_while_backing_off():
+    async def run():
+        scheduler = LLMScheduler(models=["model"], max_in_flight=1, max_wait=5)
+        # Separate keys: the rate limit on one doesn't apply to the other
+        limited = FakeClient("resources key", limited=1, retry_after=0.5)
+        fast = FakeClient("summary key")
+        resources = asyncio.create_task(
+            scheduler.complete(limited, [{"role": "user", "content": "resources"}], priority="resources"))
+        await asyncio.sleep(0.05)
+        started = time.monotonic()
+        summary = await scheduler.complete(fast, [{"role": "user", "content": "summary"}], priority="summary")
+        summary_seconds = time.monotonic() - started
+        return summary, summary_seconds, await resources, len(limited.calls)
+
+    summary, summary_seconds, resources, resources_calls = asyncio.run(run())
+    assert summary == "summary" and resources == "resources"
+    assert summary_seconds < 0.25
+    assert resources_calls == 2
+
+
+def test_slots_are_released_after_failures():
+    async def run():
+        scheduler = LLMScheduler(models=["model"], max_in_flight=1, max_attempts=1, max_wait=0)
+        with pytest.raises(groq.RateLimitError):
+            await scheduler.complete(FakeClient(limited=1), [{"role": "user", "content": "a"}])
+        return await asyncio.wait_for(scheduler.complete(FakeClient(), [{"role": "user", "content": "b"}]), 1)
+
+    assert asyncio.run(run()) == "b"
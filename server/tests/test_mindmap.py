@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("graphviz")
+
+from mindmap_v2 import create_graph_model  # noqa: E402
+
+MIND_MAP = {
+    "title": {"text": "Brains and computers", "description": "How they differ"},
+    "categories": [
+        {"text": "Neurons", "description": "Brain cells", "subcategories": [
+            {"text": "Dendrites", "description": "Inputs", "subcategories": []},
+            {"text": "Axon", "description": "Output", "subcategories": []},
+        ]},
+        {"text": "Transistors", "description": "Switches", "subcategories": [
+            {"text": "Logic gates", "description": "Simple chains", "subcategories": []},
+        ]},
+        {"text": "Neurons", "description": "Repeated title", "subcategories": []},
+    ],
+}
+
+
+def test_graph_model_has_a_node_per_item_and_an_edge_per_parent():
+    graph = create_graph_model(MIND_MAP)
+    nodes = {node["id"]: node for node in graph["nodes"]}
+    assert len(graph["nodes"]) == 7 and len(nodes) == 7
+    assert nodes["center"]["level"] == 0 and nodes["center"]["text"] == "Brains and computers"
+    assert len(graph["edges"]) == 6
+    assert sum(1 for edge in graph["edges"] if edge["source"] == "center") == 3
+    assert all(edge["source"] in nodes and edge["target"] in nodes for edge in graph["edges"])
+    # Children take their category's color and sit one level down
+    by_text = {}
+    for node in graph["nodes"]:
+        by_text.setdefault(node["text"], []).append(node)
+    assert len(by_text["Neurons"]) == 2
+    assert by_text["Axon"][0]["color"] == by_text["Neurons"][0]["color"]
+    assert by_text["Axon"][0]["level"] == 2
+
+
+def test_graph_model_positions_every_node_in_every_layout():
+    graph = create_graph_model(MIND_MAP)
+    ids = {node["id"] for node in graph["nodes"]}
+    assert set(graph["layouts"]) == {"radial", "horizontal", "vertical", "force"}
+    for positions in graph["layouts"].values():
+        assert set(positions) == ids
+        assert all(0 <= x <= 1 and 0 <= y <= 1 for x, y in positions.values())
+    assert graph["themes"]
+    assert create_graph_model(MIND_MAP)["layouts"] == graph["layouts"]
+
+
+class TestStoredRenders:
+    @pytest.fixture
+    def server(self, monkeypatch):
+        pytest.importorskip("fastapi")
+        server = pytest.importorskip("server")
+        from cache import CountingCache, MemoryCache
+        renders = []
+
+        async def render_mind_map(data, dpi, theme, layout):
+            renders.append((theme, layout))
+            return {"svg": f"<svg>{theme} {layout}</svg>", "theme": theme, "layout": layout}
+
+        monkeypatch.setattr(server, "render_mind_map", render_mind_map)
+        monkeypatch.setattr(server, "mindmap_store", CountingCache(MemoryCache(), "mindmaps"))
+        monkeypatch.setattr(server, "render_cache", CountingCache(MemoryCache(), "renders"))
+        return server, renders
+
+    def test_renders_are_cached_per_id_theme_and_layout(self, server):
+        server, renders = server
+        mindmap_id = server.store_mind_map(MIND_MAP)
+        first = asyncio.run(server.render_stored_mind_map(mindmap_id, "radial", "dark"))
+        assert asyncio.run(server.render_stored_mind_map(mindmap_id, "radial", "dark")) == first
+        asyncio.run(server.render_stored_mind_map(mindmap_id, "radial", "light"))
+        asyncio.run(server.render_stored_mind_map(mindmap_id, "horizontal", "dark"))
+        assert renders == [("dark", "radial"), ("light", "radial"), ("dark", "horizontal")]
+        assert json.loads(first)["id"] == mindmap_id
+
+    def test_structure_ids_depend_only_on_content(self, server):
+        server, _ = server
+        assert server.store_mind_map(MIND_MAP) == server.store_mind_map(json.loads(json.dumps(MIND_MAP)))
+
+    def test_render_endpoint(self, server):
+        server, _ = server
+        pytest.importorskip("httpx")
+        from fastapi.testclient import TestClient
+        client = TestClient(server.app)
+        mindmap_id = server.store_mind_map(MIND_MAP)
+        response = client.get(f"/mindmap/{mindmap_id}", params={"theme": "light", "layout": "vertical"})
+        assert response.status_code == 200
+        assert response.json()["svg"] == "<svg>light vertical</svg>"
+        assert client.get("/mindmap/unknown").status_code == 404
@@ -0,0 +1,101 @@
+import random
+
+from normalize import PAGE_BREAK, normalize_text
+
+
+def body(page: int, lines: int = 20) -> list:
+    rng = random.Random(page)
+    words = "cells divide energy membrane protein signal neuron tissue organ growth".split()
+    return [f"{' '.join(rng.choice(words) for _ in range(12))} ({page}.{line})." for line in range(lines)]
+
+
+def book(pages: int = 10, lines: int = 20) -> str:
+    return PAGE_BREAK.join(
+        "\n".join(["Introduction to Biology", f"Chapter {1 + page // 5}"] + body(page, lines)
+                  + [f"Page {page + 1} of {pages}"])
+        for page in range(pages)
+    )
+
+
+def test_headers_footers_and_page_numbers_are_removed():
+    normalized, report = normalize_text(book())
+    pages = normalized.split(PAGE_BREAK)
+    assert len(pages) == 10
+    assert "Introduction to Biology" not in normalized
+    assert "Page 3 of 10" not in normalized
+    assert "Chapter" not in normalized
+    assert all(page.split("\n") == body(i) for i, page in enumerate(pages))
+    assert report["boilerplate_lines"] == 30
+    assert report["tokens_after"] < report["tokens_before"]
+
+
+def test_short_pages_keep_every_line():
+    text = PAGE_BREAK.join(f"Exercise {i}\nSolve x + {i} = 0" for i in range(1, 5))
+    normalized, report = normalize_text(text)
+    assert normalized == text
+    assert report["boilerplate_lines"] == 0
+
+
+def test_many_short_pages_keep_every_line():
+    text = PAGE_BREAK.join(f"Exercise {i}\nSolve x + {i} = 0\nHint: isolate x" for i in range(500))
+    normalized, report = normalize_text(text)
+    assert normalized == text
+    assert report["tokens_after"] == report["tokens_before"]
+
+
+def test_repeats_at_different_offsets_are_not_boilerplate():
+    pages = []
+    for page in range(6):
+        lines = body(page)
+        # The same line, but never at the same distance from the top of the page more than twice
+        lines.insert(page % 3, "Remember: a cell is the smallest unit of life")
+        pages.append("\n".join(lines))
+    normalized, report = normalize_text(PAGE_BREAK.join(pages))
+    assert normalized.count("Remember: a cell is the smallest unit of life") == 6
+    assert report["boilerplate_lines"] == 0
+
+
+def test_long_repeated_lines_are_content():
+    template = ["Name the part of the cell shown in the figure below and describe what it does.",
+                "Write your answer in complete sentences, using the vocabulary from this unit.",
+                "Show how you reached your answer, and check it against the key on the last page."]
+    pages = [PAGE_BREAK.join(["\n".join(template + [f"Figure {i}", "(a)", "(b)", "(c)"] + template)
+                              for i in range(8)])]
+    normalized, report = normalize_text(pages[0])
+    assert normalized.count(template[0]) == 16
+    assert report["boilerplate_lines"] == 0
+
+
+def deck(slides: int = 20) -> list:
+    rng = random.Random(slides)
+    words = "loss gradient weights bias layer batch epoch model data error".split()
+    return [[f"Slide {slide}: {rng.choice(words).title()} {rng.choice(words)}"]
+            + [f"- {' '.join(rng.choice(words) for _ in range(4))}" for _ in range(2 + slide % 3)]
+            for slide in range(1, slides + 1)]
+
+
+def test_slide_headers_and_footers_are_removed():
+    slides = deck()
+    text = PAGE_BREAK.join(
+        "\n".join(["CS 229 Machine Learning"] + lines + [f"Lecture 4 | {slide + 1}/20"])
+        for slide, lines in enumerate(slides)
+    )
+    boilerplate = sum(len("CS 229 Machine Learning") + len(f"Lecture 4 | {slide + 1}/20") for slide in range(20))
+    assert boilerplate > 0.25 * len(text)
+
+    normalized, report = normalize_text(text)
+    assert [page.split("\n") for page in normalized.split(PAGE_BREAK)] == slides
+    assert report["boilerplate_lines"] == 40
+
+
+def test_too_few_pages_are_left_alone():
+    text = book(pages=2)
+    normalized, report = normalize_text(text)
+    assert "Introduction to Biology" in normalized
+    assert report["boilerplate_lines"] == 0
+
+
+def test_hyphenation_whitespace_and_invisible_characters():
+    text = "The mito-\nchondria   is the power­house\n\n\n\nof the cell.\fSelf-\nAware  "
+    normalized, _ = normalize_text(text)
+    assert normalized == "The mitochondria is the powerhouse\n\nof the cell.\fSelf-\nAware"
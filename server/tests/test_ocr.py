@@ -0,0 +1,50 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from ocr import OCREnginePool, _pad_batch  # noqa: E402
+
+
+def page(height, width, background=250):
+    image = np.full((height, width), background, dtype=np.uint8)
+    image[height // 3, : width // 2] = 0
+    return image
+
+
+def test_pad_batch_pads_to_the_largest_page_with_its_background():
+    images = [page(100, 80), page(90, 100, background=200)]
+    padded = _pad_batch(images)
+    assert [image.shape for image in padded] == [(100, 100), (100, 100)]
+    assert (padded[0][:, :80] == images[0]).all() and (padded[0][:, 80:] == 250).all()
+    assert (padded[1][90:, :] == 200).all()
+    assert padded[0].dtype == np.uint8
+
+
+def test_pad_batch_gives_up_when_shapes_differ_too_much():
+    assert _pad_batch([page(1000, 100), page(100, 1000)]) is None
+    assert _pad_batch([page(10, 10), np.zeros((10, 10, 3), dtype=np.uint8)]) is None
+
+
+class FakeReader:
+    def __init__(self):
+        self.batched = []
+        self.single = 0
+
+    def readtext_batched(self, images, detail=0):
+        assert len({image.shape for image in images}) == 1
+        self.batched.append(len(images))
+        return [[f"page {image.shape}"] for image in images]
+
+    def readtext(self, image, detail=0):
+        self.single += 1
+        return [f"page {image.shape}"]
+
+
+def test_cropped_pages_of_different_sizes_are_still_batched():
+    pool = OCREnginePool(["en"])
+    reader = FakeReader()
+    pool._release(reader)
+    pool._created = 1
+    texts = pool.readtext([page(100, 80), page(95, 78), page(99, 81)], batch_size=8)
+    assert reader.batched == [3] and reader.single == 0
+    assert len(texts) == 3
@@ -0,0 +1,49 @@
+import threading
+import time
+from multiprocessing.connection import Listener
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import ocr_service  # noqa: E402
+from ocr_service import SidecarClient, SidecarUnavailable  # noqa: E402
+
+
+def test_an_unreachable_sidecar_is_skipped_until_the_retry_window_passes(tmp_path, monkeypatch):
+    client = SidecarClient(str(tmp_path / "missing.sock"))
+    with pytest.raises(SidecarUnavailable):
+        client._connect(timeout=0)
+    monkeypatch.setattr(ocr_service, "Client", lambda *args, **kwargs: pytest.fail("connected during backoff"))
+    started = time.monotonic()
+    with pytest.raises(SidecarUnavailable, match="recently"):
+        client.readtext([b"page"])
+    assert time.monotonic() - started < 0.5
+
+    client._down_until = 0.0
+    connection = object()
+    monkeypatch.setattr(ocr_service, "Client", lambda *args, **kwargs: connection)
+    assert client._connect(timeout=0) is connection
+
+
+def test_a_key_mismatch_is_reported_as_unavailable(tmp_path, monkeypatch):
+    address = str(tmp_path / "ocr.sock")
+    listener = Listener(address, family="AF_UNIX", authkey=b"sidecar key")
+
+    def accept():
+        try:
+            listener.accept()
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=accept, daemon=True)
+    thread.start()
+    monkeypatch.setattr(ocr_service, "OCR_SIDECAR_KEY", "worker key")
+    client = SidecarClient(address)
+    try:
+        with pytest.raises(SidecarUnavailable, match="rejected"):
+            client._connect(timeout=5)
+        assert client._down_until > time.monotonic()
+    finally:
+        thread.join(timeout=5)
+        listener.close()
@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+server = pytest.importorskip("server")
+
+
+def test_long_documents_are_asked_evenly_spread_chunks(monkeypatch):
+    chunks = [f"chunk {i}" for i in range(41)]
+    asked = []
+
+    async def generate_questions(content, question_number, question_difficulty):
+        asked.append(content)
+        index = content.split()[1]
+        count = int(question_number)
+        return {"questions": [f"Question {index}.{i}?" for i in range(count)],
+                "answers": [f"Answer {index}.{i}" for i in range(count)]}
+
+    monkeypatch.setattr(server, "split_into_chunks", lambda content: chunks)
+    monkeypatch.setattr(server, "generate_questions", generate_questions)
+    result = asyncio.run(server.get_questions("document", "10", "moderate"))
+
+    assert len(asked) == 10
+    assert asked[0] == "chunk 0" and asked[-1] == "chunk 40"
+    assert len(result["questions"]) == 10
+    assert {question.split()[1].split(".")[0] for question in result["questions"]} == \
+        {chunk.split()[1] for chunk in asked}
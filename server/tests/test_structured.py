@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+pytest.importorskip("groq")
+pytest.importorskip("pydantic")
+pytest.importorskip("prometheus_client")
+
+from structured import MindMap, QuestionSet, parse_structured, repair_json  # noqa: E402
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"a": 1}', {"a": 1}),
+    ('```json\n{"a": [1, 2]}\n```', {"a": [1, 2]}),
+    ('Here is the JSON you asked for: {"a": "b"} Hope it helps!', {"a": "b"}),
+    ("{'a': 'it\\'s', 'b': True, 'c': None, 'd': False}", {"a": "it's", "b": True, "c": None, "d": False}),
+    ('{"a": [1, 2, ], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+    ('{"a": "line one\nline two"}', {"a": "line one\nline two"}),
+    ("{'a': 'say \"hi\"'}", {"a": 'say "hi"'}),
+    ('[{"a": -1.5e3}]', [{"a": -1500.0}]),
+])
+def test_repair_json_fixes_almost_json(raw, expected):
+    assert json.loads(repair_json(raw)) == expected
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"questions": ["Q1?", "Q2?"], "answers": ["A1", "A2', {"questions": ["Q1?", "Q2?"], "answers": ["A1"]}),
+    ('{"a": {"b": [1, 2, 3', {"a": {"b": [1, 2]}}),
+    ('{"a": 1, "b": tr', {"a": 1}),
+    ('{"a": 1, "b":', {"a": 1}),
+    ('{"a": 1, "b', {"a": 1}),
+    ('[1, [2, 3], [4,', [1, [2, 3], [4]]),
+    ('{"a": [125, 12', {"a": [125]}),
+])
+def test_repair_json_cuts_truncated_output_back_to_complete_values(raw, expected):
+    assert json.loads(repair_json(raw)) == expected
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ('{"n": 12', {}),
+    ('{"questions": ["What is', {}),
+    ('[{"a": ', []),
+    ('{', {}),
+])
+def test_repair_json_closes_replies_cut_off_before_any_value_empty(raw, expected):
+    assert json.loads(repair_json(raw)) == expected
+
+
+def test_repair_json_stops_at_the_end_of_the_first_value():
+    assert json.loads(repair_json('{"a": 1} and also {"b": 2}')) == {"a": 1}
+
+
+def test_repair_json_leaves_text_without_json_alone():
+    assert repair_json("  no json here ") == "no json here"
+
+
+def test_parse_structured_keeps_complete_question_pairs():
+    questions = parse_structured('{"questions": ["Q1?", "Q2?", "Q3?"], "answers": ["A1", "A2", "A', QuestionSet)
+    assert questions.questions == ["Q1?", "Q2?"]
+    assert questions.answers == ["A1", "A2"]
+
+
+def test_parse_structured_fills_mind_map_defaults():
+    mind_map = parse_structured("{'title': {'text': 'Brains'}, 'categories': [{'text': 'Neurons'}]}", MindMap)
+    assert mind_map.title.text == "Brains"
+    assert mind_map.categories[0].description == ""
+    assert mind_map.categories[0].subcategories == []
+
+
+@pytest.mark.parametrize("raw", [
+    "not json at all",
+    '{"questions": [], "answers": []}',
+    '{"questions": ["Q1?"]}',
+])
+def test_parse_structured_rejects_replies_that_dont_fit(raw):
+    with pytest.raises(ValueError):
+        parse_structured(raw, QuestionSet)
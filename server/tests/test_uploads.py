@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi import HTTPException  # noqa: E402
+
+import uploads  # noqa: E402
+from uploads import IngestedUpload, ingest_upload  # noqa: E402
+
+
+class EndlessUpload:
+    """An UploadFile stand-in that never runs out of data and counts what was read."""
+
+    filename = "huge.pdf"
+    size = None
+
+    def __init__(self):
+        self.bytes_read = 0
+
+    async def read(self, size: int) -> bytes:
+        self.bytes_read += size
+        return b"x" * size
+
+
+def test_uploads_spool_to_disk_past_the_threshold_and_keep_their_bytes():
+    content = bytes(range(256)) * 100
+    upload = IngestedUpload("notes.pdf", max_bytes=len(content), spool_bytes=1000)
+    try:
+        for start in range(0, len(content), 777):
+            upload.write(content[start:start + 777])
+        upload.finish()
+        assert upload.path is not None and upload.source == upload.path
+        with upload.buffer() as buffer:
+            assert bytes(buffer) == content
+        assert upload.sha256 == hashlib.sha256(content).hexdigest()
+        path = upload.path
+    finally:
+        upload.close()
+    assert not os.path.exists(path)
+
+
+def test_small_uploads_stay_in_memory():
+    upload = IngestedUpload("notes.txt", spool_bytes=1000)
+    upload.write(b"hello")
+    assert upload.path is None and bytes(upload.source) == b"hello"
+    upload.close()
+
+
+def test_oversized_uploads_are_rejected_without_reading_them_whole():
+    upload = EndlessUpload()
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ingest_upload(upload, max_bytes=3 * uploads.UPLOAD_CHUNK_BYTES))
+    assert error.value.status_code == 413
+    assert upload.bytes_read <= 4 * uploads.UPLOAD_CHUNK_BYTES
+
+
+def test_uploads_announcing_their_size_are_rejected_before_reading():
+    upload = EndlessUpload()
+    upload.size = 10 * uploads.UPLOAD_CHUNK_BYTES
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(ingest_upload(upload, max_bytes=uploads.UPLOAD_CHUNK_BYTES))
+    assert error.value.status_code == 413
+    assert upload.bytes_read == 0
+
+
+class TestEndpoints:
+    @pytest.fixture
+    def server(self, monkeypatch):
+        pytest.importorskip("httpx")
+        server = pytest.importorskip("server")
+
+        async def process_content(content, *args):
+            return {"length": len(content)}
+
+        monkeypatch.setattr(server, "process_content", process_content)
+        return server
+
+    FORM = {"summary_length": "short", "question_number": "5", "question_difficulty": "easy",
+            "analysis_type": "summary", "layout": "radial", "theme": "dark"}
+
+    def test_bodies_over_the_limit_get_413(self, server, monkeypatch):
+        from fastapi.testclient import TestClient
+        monkeypatch.setattr(server, "MAX_UPLOAD_BYTES", 1024)
+        monkeypatch.setattr(server, "UPLOAD_OVERHEAD_BYTES", 0)
+        response = TestClient(server.app).post(
+            "/analyze-content", data=self.FORM, files={"document": ("big.txt", b"x" * 100_000, "text/plain")})
+        assert response.status_code == 413
+
+    def test_spooled_uploads_reach_read_document_unchanged(self, server, monkeypatch):
+        from fastapi.testclient import TestClient
+        content = b"line of notes\n" * (uploads.UPLOAD_SPOOL_BYTES // 14 + 1000)
+        seen = {}
+
+        async def read_document(upload, on_pages=None):
+            seen["path"] = upload.path
+            with upload.buffer() as buffer:
+                seen["content"] = bytes(buffer)
+            seen["sha256"] = upload.sha256
+            return "text"
+
+        monkeypatch.setattr(server, "read_document", read_document)
+        response = TestClient(server.app).post(
+            "/analyze-content", data=self.FORM, files={"document": ("notes.txt", content, "text/plain")})
+        assert response.status_code == 200
+        assert seen["path"] is not None
+        assert seen["content"] == content
+        assert seen["sha256"] == hashlib.sha256(content).hexdigest()
@@ -0,0 +1,146 @@
+"""
+Streaming upload ingestion.
+
+Uploads are copied chunk by chunk into a buffer that stays in memory while it
+is small and rolls over to a named temporary file once it grows past
+UPLOAD_SPOOL_BYTES. Parsers then read from the buffer in place: small files as
+a bytearray, large files by path or through a memory map. Uploads larger than
+MAX_UPLOAD_BYTES are rejected with a 413 before they are fully read. The
+SHA-256 of the upload is computed while it streams in.
+"""
+
+import hashlib
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Optional, Union
+
+from fastapi import HTTPException, UploadFile
+
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # 1MB chunks
+
+
+def upload_too_large(size: Optional[int] = None) -> HTTPException:
+    """Build the error returned for uploads over MAX_UPLOAD_BYTES."""
+    limit_mb = MAX_UPLOAD_BYTES / (1024 * 1024)
+    if size is None:
+        return HTTPException(status_code=413, detail=f"File is larger than the {limit_mb:g} MB limit")
+    return HTTPException(status_code=413, detail=f"File is {size / (1024 * 1024):.1f} MB, the limit is {limit_mb:g} MB")
+
+
+class IngestedUpload:
+    """
+    An uploaded file spooled to memory or, past the spool threshold, to disk.
+    """
+
+    def __init__(self, filename: str, max_bytes: int = MAX_UPLOAD_BYTES, spool_bytes: int = UPLOAD_SPOOL_BYTES):
+        self.filename = filename
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.spool_bytes = spool_bytes
+        self._memory: Optional[bytearray] = bytearray()
+        self._file = None
+
+    @property
+    def sha256(self) -> str:
+        """Hex digest of the bytes written so far."""
+        return self._hash.hexdigest()
+
+    @property
+    def path(self) -> Optional[str]:
+        """Path of the spooled file, or None while the upload is held in memory."""
+        return self._file.name if self._file is not None else None
+
+    @property
+    def source(self) -> Union[bytearray, str]:
+        """What parsers should open: the in-memory bytes or the spooled file's path."""
+        return self._memory if self._file is None else self._file.name
+
+    def write(self, chunk: bytes) -> None:
+        if self.size + len(chunk) > self.max_bytes:
+            raise upload_too_large()
+        self.size += len(chunk)
+        self._hash.update(chunk)
+
+        if self._file is None and self.size > self.spool_bytes:
+            suffix = os.path.splitext(self.filename or "")[1]
+            self._file = tempfile.NamedTemporaryFile(prefix="restudy-", suffix=suffix, delete=False)
+            self._file.write(self._memory)
+            self._memory = None
+
+        if self._file is None:
+            self._memory += chunk
+        else:
+            self._file.write(chunk)
+
+    def finish(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    @contextmanager
+    def buffer(self) -> Iterator[Union[memoryview, mmap.mmap]]:
+        """Expose the upload as a read-only buffer without copying it."""
+        if self._file is None:
+            with memoryview(self._memory) as view:
+                yield view
+        else:
+            with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def save(self, path: str) -> None:
+        """Copy the upload to `path`, where it outlives this object."""
+        with self.buffer() as buffer, open(path, 'wb') as output:
+            output.write(buffer)
+
+    def close(self) -> None:
+        self._memory = None
+        if self._file is not None:
+            self._file.close()
+            try:
+                os.remove(self._file.name)
+            except FileNotFoundError:
+                pass
+            self._file = None
+
+
+async def ingest_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> IngestedUpload:
+    """
+    Stream an upload into an IngestedUpload, enforcing the size cap.
+
+    Args:
+        upload: The uploaded file
+        max_bytes: Largest accepted upload, in bytes
+
+    Returns:
+        The spooled upload. Callers must close() it when done.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise upload_too_large(upload.size)
+
+    ingested = IngestedUpload(upload.filename, max_bytes=max_bytes)
+    try:
+        while chunk := await upload.read(UPLOAD_CHUNK_BYTES):
+            ingested.write(chunk)
+        ingested.finish()
+    except BaseException:
+        ingested.close()
+        raise
+    return ingested
+
+
+def ingest_file(path: str, filename: str, max_bytes: int = MAX_UPLOAD_BYTES) -> IngestedUpload:
+    """Like ingest_upload, for a file saved earlier with IngestedUpload.save."""
+    ingested = IngestedUpload(filename, max_bytes=max_bytes)
+    try:
+        with open(path, 'rb') as source:
+            while chunk := source.read(UPLOAD_CHUNK_BYTES):
+                ingested.write(chunk)
+        ingested.finish()
+    except BaseException:
+        ingested.close()
+        raise
+    return ingested